@@ -14,7 +14,9 @@ def get_module_version():
 
 
 from .processes import ReaddyActinProcess  # noqa: F401
-from vivarium.core.registry import emitter_registry  # noqa: F401
+from vivarium.core.registry import emitter_registry, updater_registry  # noqa: F401
 from .processes.simularium_emitter import SimulariumEmitter  # noqa: F401
+from .library.monomers import update_monomer_arrays  # noqa: F401
 
 emitter_registry.register("simularium", SimulariumEmitter)
+updater_registry.register("monomer_arrays", update_monomer_arrays)
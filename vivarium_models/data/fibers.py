@@ -1,5 +1,7 @@
 import numpy as np
 
+from vivarium_models.library.fibers import normalize_fibers
+
 initial_fibers = {
     "fibers_box_extent": np.array([4000.0, 2000.0, 2000.0]),
     "fibers": {
@@ -218,11 +220,15 @@ initial_fibers = {
 
 
 def centered_initial_fibers():
-    result = initial_fibers
-    for fiber_id in initial_fibers["fibers"]:
-        fiber_points = initial_fibers["fibers"][fiber_id]["points"]
-        for point_index in range(len(fiber_points)):
-            result["fibers"][fiber_id]["points"][point_index] = (
-                fiber_points[point_index] - 0.5 * initial_fibers["fibers_box_extent"]
-            )
-    return result
+    """
+    Get a copy of the initial fibers centered on the origin,
+    with each fiber's points as one (n_points, 3) array
+    """
+    fibers = normalize_fibers(initial_fibers["fibers"])
+    center = 0.5 * initial_fibers["fibers_box_extent"]
+    for fiber in fibers.values():
+        fiber["points"] = fiber["points"] - center
+    return {
+        "fibers_box_extent": initial_fibers["fibers_box_extent"].copy(),
+        "fibers": fibers,
+    }
@@ -0,0 +1,35 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackgroundWorker:
+    """
+    Run calls in order on one background thread,
+    keeping at most queue_size calls pending so the caller waits
+    for the oldest one to finish when the worker falls behind.
+    Errors raised by a call are raised again in the caller
+    """
+
+    def __init__(self, queue_size=8):
+        self.queue_size = max(queue_size, 1)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = deque()
+        self.latest = None
+
+    def submit(self, function, *args):
+        """
+        Queue a call, first waiting for room in the queue
+        """
+        while len(self.pending) >= self.queue_size:
+            self.latest = self.pending.popleft().result()
+        self.pending.append(self.executor.submit(function, *args))
+
+    def join(self):
+        """
+        Wait for all pending calls, stop the thread
+        and return the result of the last call
+        """
+        while self.pending:
+            self.latest = self.pending.popleft().result()
+        self.executor.shutdown()
+        return self.latest
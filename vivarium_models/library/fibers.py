@@ -0,0 +1,599 @@
+import heapq
+import time
+from functools import lru_cache
+
+import numpy as np
+from simularium_readdy_models.actin import (
+    ActinGenerator,
+    ActinStructure,
+    ActinUtil,
+    FiberData,
+)
+
+
+@lru_cache(maxsize=None)
+def _get_local_vector_to_axis():
+    """
+    The vector from an actin to the filament axis
+    in the basis of the actin's orientation
+    """
+    return np.linalg.inv(ActinStructure.orientation()) @ ActinStructure.vector_to_axis()
+
+
+def _normalize(vectors):
+    """
+    Normalize each row of vectors, leaving zero vectors as they are
+    """
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, lengths, out=np.copy(vectors), where=lengths > 0)
+
+
+def normalize_fiber_points(points):
+    """
+    Get a fiber's points as one contiguous (n_points, 3) float array,
+    without copying points that are already in that form,
+    so lists of separate 3-element arrays can be read the same way
+    """
+    points = np.ascontiguousarray(points, dtype=float)
+    if points.ndim == 2 and points.shape[1] == 3:
+        return points
+    return points.reshape((-1, 3))
+
+
+def normalize_fibers(fibers):
+    """
+    Get fibers data with each fiber's points normalized
+    to a contiguous (n_points, 3) float array
+    """
+    return {
+        fiber_id: {**fiber, "points": normalize_fiber_points(fiber["points"])}
+        for fiber_id, fiber in fibers.items()
+    }
+
+
+def get_fiber_unique_id(fiber_id, unique_ids):
+    """
+    Get the integer Simularium agent id of a fiber, since fiber ids
+    may be strings, numbering fibers in the order they are first seen
+    and adding them to the unique_ids dict kept between frames
+    """
+    return unique_ids.setdefault(str(fiber_id), len(unique_ids))
+
+
+def get_non_periodic_positions(centers, positions, box_size):
+    """
+    Move positions further than half the box from their center
+    across the box, for many positions at once
+    """
+    box_size = np.broadcast_to(np.asarray(box_size, dtype=float), (3,))
+    crosses = np.abs(positions - centers) > box_size / 2.0
+    return np.where(crosses, positions - np.sign(positions) * box_size, positions)
+
+
+def get_actin_axis_positions(triples, box_size, periodic_boundary=True):
+    """
+    Get the position on the filament axis closest to the middle actin
+    in each of many [previous, middle, next] actin position triples,
+    shaped (n, 3, 3), the same as ActinUtil.get_actin_axis_position
+    """
+    triples = np.asarray(triples, dtype=float).reshape((-1, 3, 3))
+    previous = triples[:, 0]
+    middle = triples[:, 1]
+    following = triples[:, 2]
+    if periodic_boundary:
+        previous = get_non_periodic_positions(middle, previous, box_size)
+        following = get_non_periodic_positions(middle, following, box_size)
+    v1 = _normalize(previous - middle)
+    v2 = _normalize(following - middle)
+    # v1 is a unit vector, so this orthogonalizes v2 against it
+    v2 = _normalize(v2 - np.sum(v1 * v2, axis=1, keepdims=True) * v1)
+    v3 = np.cross(v2, v1)
+    local = _get_local_vector_to_axis()
+    return middle + local[0] * v1 + local[1] * v2 + local[2] * v3
+
+
+def get_chain_particle_ids(start_id, particles):
+    """
+    Order the particles in a chain by walking from start_id,
+    first to its first neighbor then always away from the previous particle
+    """
+    keys = {str(particle_id): particle_id for particle_id in particles}
+    result = [start_id]
+    visited = {str(start_id)}
+    previous_key = None
+    current_id = start_id
+    while True:
+        next_id = None
+        for neighbor_id in particles[current_id]["neighbor_ids"]:
+            if str(neighbor_id) != previous_key:
+                next_id = neighbor_id
+                break
+        if next_id is None or str(next_id) in visited or str(next_id) not in keys:
+            return result
+        previous_key = str(current_id)
+        current_id = keys[str(next_id)]
+        visited.add(str(current_id))
+        result.append(current_id)
+
+
+def _get_actin_number(type_name):
+    """
+    Get the number from 1 to 3 that increases toward the barbed end
+    from an actin type name like "actin#ATP_2", or None if there isn't one
+    """
+    suffix = type_name.rsplit("_", 1)[-1]
+    return int(suffix) if suffix.isdigit() else None
+
+
+def _get_pointed_end(end_ids, actin_particles, particles):
+    """
+    Choose which end of an actin chain is the pointed end, by its type name
+    or else by the actin numbers increasing toward the barbed end
+    """
+    for end_id in end_ids:
+        type_name = particles[end_id]["type_name"]
+        if "pointed" in type_name or "branch" in type_name:
+            return end_id
+    for end_id in end_ids:
+        number = _get_actin_number(particles[end_id]["type_name"])
+        neighbor_ids = actin_particles[end_id]["neighbor_ids"]
+        if number is None or len(neighbor_ids) == 0:
+            continue
+        if _get_actin_number(particles[neighbor_ids[0]]["type_name"]) == number % 3 + 1:
+            return end_id
+    return end_ids[0]
+
+
+def get_actin_chains(monomers):
+    """
+    Break each topology into linear chains of actins, splitting branched
+    networks into mother and daughter filaments at their arp2/3 nodes
+    in one linear time traversal of the particles.
+    Returns a list of chains, each with its "topology_id", "particle_ids"
+    ordered from the pointed end, and the index of its "parent" chain and its
+    "branch_point" at the arp bound to its pointed end if it is a daughter
+    """
+    particles = monomers["particles"]
+    keys = {str(particle_id): particle_id for particle_id in particles}
+    neighbors = {
+        particle_id: [
+            keys[str(neighbor_id)]
+            for neighbor_id in particle["neighbor_ids"]
+            if str(neighbor_id) in keys
+        ]
+        for particle_id, particle in particles.items()
+    }
+    is_actin = {
+        particle_id: particle["type_name"].startswith("actin")
+        for particle_id, particle in particles.items()
+    }
+    actin_particles = {
+        particle_id: {
+            "neighbor_ids": [
+                neighbor_id
+                for neighbor_id in neighbors[particle_id]
+                if is_actin[neighbor_id]
+            ]
+        }
+        for particle_id in particles
+        if is_actin[particle_id]
+    }
+    # label each connected set of actins as a chain
+    chain_indices = {}
+    chains = []
+    for topology_id, topology in monomers["topologies"].items():
+        for start_id in topology["particle_ids"]:
+            start_id = keys.get(str(start_id))
+            if start_id not in actin_particles or start_id in chain_indices:
+                continue
+            chain_indices[start_id] = len(chains)
+            component = [start_id]
+            for current_id in component:
+                for neighbor_id in actin_particles[current_id]["neighbor_ids"]:
+                    if neighbor_id not in chain_indices:
+                        chain_indices[neighbor_id] = len(chains)
+                        component.append(neighbor_id)
+            end_ids = [
+                particle_id
+                for particle_id in component
+                if len(actin_particles[particle_id]["neighbor_ids"]) < 2
+            ]
+            pointed_id = _get_pointed_end(
+                end_ids or component, actin_particles, particles
+            )
+            chains.append(
+                {
+                    "topology_id": topology_id,
+                    "particle_ids": get_chain_particle_ids(pointed_id, actin_particles),
+                    "parent": None,
+                    "branch_point": None,
+                }
+            )
+    # find the mother of each daughter through the arps at its pointed end
+    for index, chain in enumerate(chains):
+        pointed_id = chain["particle_ids"][0]
+        if "branch" not in particles[pointed_id]["type_name"]:
+            continue
+        arp_ids = [
+            neighbor_id
+            for neighbor_id in neighbors[pointed_id]
+            if not is_actin[neighbor_id]
+        ]
+        if len(arp_ids) == 0:
+            continue
+        visited = set(arp_ids)
+        for arp_id in arp_ids:
+            for neighbor_id in neighbors[arp_id]:
+                if neighbor_id in visited:
+                    continue
+                visited.add(neighbor_id)
+                if not is_actin[neighbor_id]:
+                    arp_ids.append(neighbor_id)
+                elif chain_indices[neighbor_id] != index:
+                    chain["parent"] = chain_indices[neighbor_id]
+                    break
+            if chain["parent"] is not None:
+                break
+        if chain["parent"] is not None:
+            chain["branch_point"] = np.asarray(
+                particles[arp_ids[0]]["position"], dtype=float
+            )
+    return chains
+
+
+def get_fiber_end_points(chain_positions, box_size):
+    """
+    Get the pointed and barbed end points on the axis of many actin chains,
+    each a list of at least 4 monomer positions from the pointed end,
+    extrapolating from the axis positions of the second and third actins
+    from each end since an axis position needs a neighbor in each direction.
+    Returns an array shaped (chains, 2, 3)
+    """
+    n_chains = len(chain_positions)
+    triples = np.zeros((n_chains, 4, 3, 3))
+    for index, positions in enumerate(chain_positions):
+        positions = np.asarray(positions, dtype=float).reshape((-1, 3))
+        triples[index, 0] = positions[0:3]
+        triples[index, 1] = positions[1:4]
+        triples[index, 2] = positions[-3:]
+        triples[index, 3] = positions[-4:-1]
+    axis_positions = get_actin_axis_positions(
+        triples.reshape((-1, 3, 3)), box_size
+    ).reshape((n_chains, 4, 3))
+    end_points = np.zeros((n_chains, 2, 3))
+    end_points[:, 0] = axis_positions[:, 0] - 1.5 * (
+        axis_positions[:, 1] - axis_positions[:, 0]
+    )
+    end_points[:, 1] = axis_positions[:, 2] - 1.5 * (
+        axis_positions[:, 3] - axis_positions[:, 2]
+    )
+    return end_points
+
+
+def get_polyline_deviations(points, start, end):
+    """
+    Get the distance of each point between start and end
+    from the segment between points[start] and points[end]
+    """
+    segment = points[end] - points[start]
+    offsets = points[start + 1 : end] - points[start]
+    length_squared = np.dot(segment, segment)
+    if length_squared == 0:
+        return np.linalg.norm(offsets, axis=1)
+    fractions = np.clip(offsets @ segment / length_squared, 0.0, 1.0)
+    return np.linalg.norm(offsets - fractions[:, np.newaxis] * segment, axis=1)
+
+
+def simplify_polyline(points, tolerance=1.0, max_points=None):
+    """
+    Keep the end points of a polyline, then greedily add the point
+    that deviates most from the simplified polyline until no point
+    deviates more than tolerance or there are max_points points
+    """
+    points = np.asarray(points, dtype=float).reshape((-1, 3))
+    n_points = len(points)
+    if n_points <= 2:
+        return points
+    if max_points is None:
+        max_points = n_points
+    kept = [0, n_points - 1]
+    # heap of (-deviation, segment start, segment end, farthest point)
+    segments = []
+
+    def add_segment(start, end):
+        if end - start < 2:
+            return
+        deviations = get_polyline_deviations(points, start, end)
+        farthest = int(np.argmax(deviations))
+        heapq.heappush(
+            segments, (-deviations[farthest], start, end, start + 1 + farthest)
+        )
+
+    add_segment(0, n_points - 1)
+    while segments and len(kept) < max_points:
+        deviation, start, end, farthest = heapq.heappop(segments)
+        if -deviation <= tolerance:
+            break
+        kept.append(farthest)
+        add_segment(start, farthest)
+        add_segment(farthest, end)
+    return points[sorted(kept)]
+
+
+def get_fiber_polylines(chain_positions, box_size, tolerance=1.0, max_points=None):
+    """
+    Get a polyline along the axis of each of many actin chains,
+    each a list of at least 4 monomer positions from the pointed end,
+    through the end points and the axis positions of every actin
+    that has a neighbor in each direction, simplified to within tolerance
+    or to max_points points
+    """
+    chain_positions = [
+        np.asarray(positions, dtype=float).reshape((-1, 3))
+        for positions in chain_positions
+    ]
+    if len(chain_positions) == 0:
+        return []
+    # axis positions for all interior actins of all chains at once
+    triples = np.concatenate(
+        [
+            np.stack([positions[:-2], positions[1:-1], positions[2:]], axis=1)
+            for positions in chain_positions
+        ]
+    )
+    axis_positions = get_actin_axis_positions(triples, box_size)
+    offsets = np.cumsum([len(positions) - 2 for positions in chain_positions])
+    result = []
+    for chain_axis in np.split(axis_positions, offsets[:-1]):
+        pointed_end = chain_axis[0] - 1.5 * (chain_axis[1] - chain_axis[0])
+        barbed_end = chain_axis[-1] - 1.5 * (chain_axis[-2] - chain_axis[-1])
+        result.append(
+            simplify_polyline(
+                np.vstack([pointed_end, chain_axis, barbed_end]),
+                tolerance,
+                max_points,
+            )
+        )
+    return result
+
+
+def segments_intersect_box(starts, ends, min_extent, max_extent):
+    """
+    Check which line segments intersect an axis aligned box
+    by clipping each segment to the slab between the box's faces in each axis
+    """
+    directions = ends - starts
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t1 = (min_extent - starts) / directions
+        t2 = (max_extent - starts) / directions
+    parallel = directions == 0
+    inside = (starts >= min_extent) & (starts <= max_extent)
+    t_near = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2))
+    t_far = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+    t_enter = np.max(t_near, axis=1)
+    t_exit = np.min(t_far, axis=1)
+    return (t_enter <= t_exit) & (t_exit >= 0.0) & (t_enter <= 1.0)
+
+
+class FiberIndex:
+    """
+    A uniform grid over the bounding boxes of fiber segments,
+    to find the fibers that have a segment inside a box
+    without checking every fiber
+    """
+
+    def __init__(self, fibers, cell_size=None):
+        fiber_points = [
+            normalize_fiber_points(fiber["points"]) for fiber in fibers.values()
+        ]
+        n_points = np.array([len(points) for points in fiber_points], dtype=int)
+        has_segments = n_points >= 2
+        self.fiber_ids = [
+            fiber_id for fiber_id, keep in zip(fibers, has_segments) if keep
+        ]
+        self.n_segments = int(np.sum(n_points[has_segments] - 1))
+        if self.n_segments == 0:
+            return
+        points = np.concatenate(
+            [points for points, keep in zip(fiber_points, has_segments) if keep]
+        )
+        # every point but the last of each fiber starts a segment
+        is_start = np.ones(len(points), dtype=bool)
+        is_start[np.cumsum(n_points[has_segments]) - 1] = False
+        start_indices = np.flatnonzero(is_start)
+        self.starts = points[start_indices]
+        self.ends = points[start_indices + 1]
+        self.segment_fibers = np.repeat(
+            np.arange(len(self.fiber_ids)), n_points[has_segments] - 1
+        )
+        lower = np.minimum(self.starts, self.ends)
+        upper = np.maximum(self.starts, self.ends)
+        self.origin = np.min(lower, axis=0)
+        extent = np.max(upper, axis=0) - self.origin
+        if cell_size is None:
+            # about one cell per segment, but at least as large as most segments
+            cell_size = max(
+                np.cbrt(np.prod(np.maximum(extent, 1.0)) / self.n_segments),
+                np.median(np.max(upper - lower, axis=1)),
+                1.0,
+            )
+        self.cell_size = cell_size
+        self.shape = np.floor(extent / cell_size).astype(int) + 1
+        # add each segment to every cell its bounding box overlaps
+        first_cells = self.get_cells(lower)
+        n_cells = self.get_cells(upper) - first_cells + 1
+        counts = np.prod(n_cells, axis=1)
+        segments = np.repeat(np.arange(self.n_segments), counts)
+        offsets = np.arange(len(segments)) - np.repeat(
+            np.cumsum(counts) - counts, counts
+        )
+        cells = np.zeros((len(segments), 3), dtype=int)
+        for dim in reversed(range(3)):
+            cells[:, dim] = offsets % n_cells[segments, dim]
+            offsets //= n_cells[segments, dim]
+        cell_keys = self.get_cell_keys(first_cells[segments] + cells)
+        order = np.argsort(cell_keys, kind="stable")
+        self.cell_keys = cell_keys[order]
+        self.cell_segments = segments[order]
+
+    def get_cells(self, positions):
+        return np.clip(
+            np.floor((positions - self.origin) / self.cell_size).astype(int),
+            0,
+            self.shape - 1,
+        )
+
+    def get_cell_keys(self, cells):
+        return (cells[..., 0] * self.shape[1] + cells[..., 1]) * self.shape[2] + cells[
+            ..., 2
+        ]
+
+    def query_box(self, min_extent, max_extent):
+        """
+        Get the ids of fibers with a segment that intersects a box,
+        in the order they were indexed
+        """
+        if self.n_segments == 0:
+            return []
+        min_extent = np.asarray(min_extent, dtype=float)
+        max_extent = np.asarray(max_extent, dtype=float)
+        if np.any(max_extent < self.origin) or np.any(
+            min_extent > self.origin + self.cell_size * self.shape
+        ):
+            return []
+        first_cell = self.get_cells(min_extent)
+        last_cell = self.get_cells(max_extent)
+        cells = np.stack(
+            np.meshgrid(
+                *[np.arange(first_cell[dim], last_cell[dim] + 1) for dim in range(3)],
+                indexing="ij",
+            ),
+            axis=-1,
+        ).reshape((-1, 3))
+        keys = self.get_cell_keys(cells)
+        lefts = np.searchsorted(self.cell_keys, keys, side="left")
+        rights = np.searchsorted(self.cell_keys, keys, side="right")
+        candidates = np.unique(
+            np.concatenate(
+                [self.cell_segments[left:right] for left, right in zip(lefts, rights)]
+            )
+        )
+        hits = candidates[
+            segments_intersect_box(
+                self.starts[candidates], self.ends[candidates], min_extent, max_extent
+            )
+        ]
+        return [self.fiber_ids[index] for index in np.unique(self.segment_fibers[hits])]
+
+
+def get_actin_helix(axis_positions):
+    """
+    Get positions of actins along a filament
+    with one actin per point in axis_positions, shaped (n, 3),
+    assuming the axis bends slowly away from the x axis
+    """
+    axis_positions = np.asarray(axis_positions, dtype=float)
+    radius = ActinStructure.actin_distance_from_axis()
+    angles = np.arange(len(axis_positions)) * ActinStructure.actin_to_actin_axis_angle()
+    return axis_positions + radius * np.column_stack(
+        [np.zeros(len(angles)), np.cos(angles), np.sin(angles)]
+    )
+
+
+def benchmark_fiber_end_points(n_chains=2000, chain_length=50, box_size=500.0):
+    """
+    Compare the time to fit fiber end points for many actin chains
+    one axis position at a time with ActinUtil, or batched,
+    and the time to fit polylines to bent chains
+    """
+    rng = np.random.default_rng(0)
+    rise = ActinStructure.actin_to_actin_axis_distance
+    helix = get_actin_helix(
+        np.column_stack(
+            [
+                rise * np.arange(chain_length),
+                np.zeros(chain_length),
+                np.zeros(chain_length),
+            ]
+        )
+    )
+    chains = [helix + rng.normal(scale=0.1, size=helix.shape) for _ in range(n_chains)]
+    box = np.full(3, box_size)
+    start = time.perf_counter()
+    for positions in chains:
+        for triple in [
+            positions[0:3],
+            positions[1:4],
+            positions[-3:],
+            positions[-4:-1],
+        ]:
+            ActinUtil.get_actin_axis_position(list(triple), box)
+    looped = time.perf_counter() - start
+    start = time.perf_counter()
+    get_fiber_end_points(chains, box)
+    batched = time.perf_counter() - start
+    print(f"{n_chains} chains: looped {looped:.4f} s, batched {batched:.4f} s")
+    x = rise * np.arange(10 * chain_length)
+    bent_helix = get_actin_helix(
+        np.column_stack([x, 20.0 * np.sin(x / 150.0), np.zeros(len(x))])
+    )
+    bent_chains = [
+        bent_helix + rng.normal(scale=0.1, size=bent_helix.shape)
+        for _ in range(n_chains // 2)
+    ]
+    start = time.perf_counter()
+    polylines = get_fiber_polylines(bent_chains, box, tolerance=1.0)
+    seconds = time.perf_counter() - start
+    mean_points = np.mean([len(points) for points in polylines])
+    print(
+        f"{len(bent_chains)} bent chains of {len(x)} actins: "
+        f"polylines {seconds:.4f} s, {mean_points:.1f} points on average"
+    )
+
+
+def benchmark_fiber_index(
+    fiber_counts=(100, 1000, 10000, 100000),
+    box_extent=(4000.0, 2000.0, 2000.0),
+    monomer_box_size=500.0,
+):
+    """
+    Compare the time to crop random straight fibers in a large box
+    to a fixed monomer box, for every fiber, or for only the fibers
+    a FiberIndex finds in the box
+    """
+    rng = np.random.default_rng(0)
+    box_extent = np.array(box_extent)
+    box_center = 0.5 * box_extent
+    min_extent = box_center - monomer_box_size / 2.0
+    max_extent = box_center + monomer_box_size / 2.0
+    for n_fibers in fiber_counts:
+        starts = rng.uniform(0.0, box_extent, (n_fibers, 3))
+        directions = rng.normal(size=(n_fibers, 3))
+        directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+        ends = starts + rng.uniform(50.0, 300.0, (n_fibers, 1)) * directions
+        fibers = {
+            fiber_id: {"points": np.stack([starts[fiber_id], ends[fiber_id]])}
+            for fiber_id in range(n_fibers)
+        }
+        start = time.perf_counter()
+        ActinGenerator.get_cropped_fibers(
+            [FiberData(i, fibers[i]["points"]) for i in fibers], min_extent, max_extent
+        )
+        crop_all = time.perf_counter() - start
+        start = time.perf_counter()
+        found_ids = FiberIndex(fibers).query_box(min_extent, max_extent)
+        ActinGenerator.get_cropped_fibers(
+            [FiberData(i, fibers[i]["points"]) for i in found_ids],
+            min_extent,
+            max_extent,
+        )
+        indexed = time.perf_counter() - start
+        print(
+            f"{n_fibers} fibers, {len(found_ids)} in box: "
+            f"crop all {crop_all:.4f} s, index and crop found {indexed:.4f} s"
+        )
+
+
+if __name__ == "__main__":
+    benchmark_fiber_end_points()
+    benchmark_fiber_index()
@@ -0,0 +1,559 @@
+import time
+
+import numpy as np
+
+
+def get_readdy_monomer_arrays(current_topologies):
+    """
+    Get columnar data for the particles in ReaDDy's current topologies:
+    particle ids, type codes indexing into a list of type names,
+    an (N, 3) array of positions, and neighbor ids in CSR form
+    where particle i's neighbors are
+    neighbor_ids[neighbor_offsets[i]:neighbor_offsets[i + 1]]
+    """
+    ids = []
+    type_codes = []
+    type_names = []
+    type_name_codes = {}
+    positions = []
+    neighbor_counts = []
+    neighbor_ids = []
+    topologies = {}
+    for index, topology in enumerate(current_topologies):
+        particle_ids = []
+        for vertex in topology.graph.get_vertices():
+            particle_id = topology.particle_id_of_vertex(vertex)
+            particle_ids.append(particle_id)
+            type_name = topology.particle_type_of_vertex(vertex)
+            if type_name not in type_name_codes:
+                type_name_codes[type_name] = len(type_names)
+                type_names.append(type_name)
+            type_codes.append(type_name_codes[type_name])
+            position = topology.position_of_vertex(vertex)
+            positions.append([position[0], position[1], position[2]])
+            n_neighbors = 0
+            for neighbor in vertex:
+                neighbor_ids.append(topology.particle_id_of_vertex(neighbor.get()))
+                n_neighbors += 1
+            neighbor_counts.append(n_neighbors)
+        ids += particle_ids
+        topologies[index] = {
+            "type_name": topology.type,
+            "particle_ids": particle_ids,
+        }
+    neighbor_offsets = np.zeros(len(ids) + 1, dtype=int)
+    np.cumsum(neighbor_counts, out=neighbor_offsets[1:])
+    return {
+        "ids": np.array(ids, dtype=int),
+        "type_names": type_names,
+        "type_codes": np.array(type_codes, dtype=int),
+        "positions": np.array(positions, dtype=float).reshape((-1, 3)),
+        "neighbor_offsets": neighbor_offsets,
+        "neighbor_ids": np.array(neighbor_ids, dtype=int),
+        "topologies": topologies,
+    }
+
+
+def get_monomers_from_arrays(monomer_arrays):
+    """
+    Build the dict form of monomer data used by the monomers store
+    from columnar monomer arrays
+    """
+    ids = monomer_arrays["ids"].tolist()
+    type_names = monomer_arrays["type_names"]
+    type_codes = monomer_arrays["type_codes"].tolist()
+    positions = monomer_arrays["positions"]
+    neighbor_offsets = monomer_arrays["neighbor_offsets"].tolist()
+    neighbor_ids = monomer_arrays["neighbor_ids"].tolist()
+    particles = {}
+    for index, particle_id in enumerate(ids):
+        particles[particle_id] = {
+            "type_name": type_names[type_codes[index]],
+            "position": positions[index],
+            "neighbor_ids": neighbor_ids[
+                neighbor_offsets[index] : neighbor_offsets[index + 1]
+            ],
+        }
+    return {
+        "topologies": monomer_arrays["topologies"],
+        "particles": particles,
+    }
+
+
+def _get_integer_ids(ids):
+    """
+    Columnar monomer arrays need integer particle ids (or strs of integers),
+    so particles generated with uuids can't be stored in them
+    """
+    try:
+        return np.array(ids, dtype=int)
+    except (TypeError, ValueError):
+        raise ValueError(
+            "columnar monomer arrays need integer particle ids, "
+            "for example from ActinGenerator.get_monomers(use_uuids=False)"
+        )
+
+
+def get_monomer_arrays(monomers):
+    """
+    Get columnar monomer arrays from the dict form of monomer data,
+    the inverse of get_monomers_from_arrays,
+    raising a ValueError if particle ids are not integers
+    """
+    particles = monomers["particles"]
+    type_names = []
+    type_name_codes = {}
+    type_codes = []
+    neighbor_counts = []
+    neighbor_ids = []
+    for particle in particles.values():
+        type_name = particle["type_name"]
+        if type_name not in type_name_codes:
+            type_name_codes[type_name] = len(type_names)
+            type_names.append(type_name)
+        type_codes.append(type_name_codes[type_name])
+        neighbor_counts.append(len(particle["neighbor_ids"]))
+        neighbor_ids += list(particle["neighbor_ids"])
+    neighbor_offsets = np.zeros(len(particles) + 1, dtype=int)
+    np.cumsum(neighbor_counts, out=neighbor_offsets[1:])
+    return {
+        "ids": _get_integer_ids(list(particles.keys())),
+        "type_names": type_names,
+        "type_codes": np.array(type_codes, dtype=int),
+        "positions": np.array(
+            [particle["position"] for particle in particles.values()], dtype=float
+        ).reshape((-1, 3)),
+        "neighbor_offsets": neighbor_offsets,
+        "neighbor_ids": _get_integer_ids(neighbor_ids),
+        "topologies": monomers["topologies"],
+    }
+
+
+def get_particle_indices(monomer_arrays, particle_ids):
+    """
+    Get the indices in columnar monomer arrays of particles with the given ids,
+    raising a ValueError if any of them are not in the arrays
+    """
+    ids = monomer_arrays["ids"]
+    particle_ids = np.asarray(particle_ids, dtype=int)
+    if len(ids) == 0:
+        if len(particle_ids) > 0:
+            raise ValueError(f"particle ids {particle_ids.tolist()} not found")
+        return np.zeros(0, dtype=int)
+    sorter = np.argsort(ids)
+    found = np.minimum(np.searchsorted(ids, particle_ids, sorter=sorter), len(ids) - 1)
+    indices = sorter[found]
+    missing = ids[indices] != particle_ids
+    if np.any(missing):
+        raise ValueError(f"particle ids {particle_ids[missing].tolist()} not found")
+    return indices
+
+
+def get_empty_monomer_arrays():
+    """
+    Get columnar monomer arrays with no particles
+    """
+    return {
+        "ids": np.zeros(0, dtype=int),
+        "type_names": [],
+        "type_codes": np.zeros(0, dtype=int),
+        "positions": np.zeros((0, 3)),
+        "neighbor_offsets": np.zeros(1, dtype=int),
+        "neighbor_ids": np.zeros(0, dtype=int),
+        "topologies": {},
+    }
+
+
+def get_monomer_arrays_subset(monomer_arrays, indices):
+    """
+    Get columnar monomer arrays for the particles at the given indices
+    """
+    indices = np.asarray(indices, dtype=int)
+    neighbor_offsets = monomer_arrays["neighbor_offsets"]
+    starts = neighbor_offsets[indices]
+    counts = neighbor_offsets[indices + 1] - starts
+    subset_offsets = np.zeros(len(indices) + 1, dtype=int)
+    np.cumsum(counts, out=subset_offsets[1:])
+    neighbor_indices = np.repeat(starts - subset_offsets[:-1], counts) + np.arange(
+        subset_offsets[-1]
+    )
+    return {
+        "ids": monomer_arrays["ids"][indices],
+        "type_names": monomer_arrays["type_names"],
+        "type_codes": monomer_arrays["type_codes"][indices],
+        "positions": monomer_arrays["positions"][indices],
+        "neighbor_offsets": subset_offsets,
+        "neighbor_ids": monomer_arrays["neighbor_ids"][neighbor_indices],
+        "topologies": monomer_arrays["topologies"],
+    }
+
+
+def concatenate_monomer_arrays(monomer_arrays_list, topologies=None):
+    """
+    Join columnar monomer arrays, merging their type names
+    and their topologies unless topologies are given
+    """
+    type_names = []
+    type_name_codes = {}
+    type_codes = []
+    neighbor_counts = []
+    merged_topologies = {}
+    for monomer_arrays in monomer_arrays_list:
+        codes = []
+        for type_name in monomer_arrays["type_names"]:
+            if type_name not in type_name_codes:
+                type_name_codes[type_name] = len(type_names)
+                type_names.append(type_name)
+            codes.append(type_name_codes[type_name])
+        type_codes.append(np.array(codes, dtype=int)[monomer_arrays["type_codes"]])
+        neighbor_counts.append(np.diff(monomer_arrays["neighbor_offsets"]))
+        merged_topologies.update(monomer_arrays["topologies"])
+    if len(monomer_arrays_list) == 0:
+        return get_empty_monomer_arrays()
+    neighbor_counts = np.concatenate(neighbor_counts)
+    neighbor_offsets = np.zeros(len(neighbor_counts) + 1, dtype=int)
+    np.cumsum(neighbor_counts, out=neighbor_offsets[1:])
+    return {
+        "ids": np.concatenate([arrays["ids"] for arrays in monomer_arrays_list]),
+        "type_names": type_names,
+        "type_codes": np.concatenate(type_codes),
+        "positions": np.concatenate(
+            [arrays["positions"] for arrays in monomer_arrays_list]
+        ).reshape((-1, 3)),
+        "neighbor_offsets": neighbor_offsets,
+        "neighbor_ids": np.concatenate(
+            [arrays["neighbor_ids"] for arrays in monomer_arrays_list]
+        ),
+        "topologies": merged_topologies if topologies is None else topologies,
+    }
+
+
+def _get_neighbor_counts(monomer_arrays, indices):
+    neighbor_offsets = monomer_arrays["neighbor_offsets"]
+    return neighbor_offsets[indices + 1] - neighbor_offsets[indices]
+
+
+def _get_padded_neighbor_ids(monomer_arrays, indices, width):
+    """
+    Get the neighbor ids of the particles at the given indices
+    as rows of the given width padded with -1
+    """
+    starts = monomer_arrays["neighbor_offsets"][indices]
+    counts = _get_neighbor_counts(monomer_arrays, indices)
+    result = np.full((len(indices), width), -1, dtype=int)
+    columns = np.arange(result.shape[1])
+    has_neighbor = columns < counts[:, np.newaxis]
+    result[has_neighbor] = monomer_arrays["neighbor_ids"][
+        (starts[:, np.newaxis] + columns)[has_neighbor]
+    ]
+    return result
+
+
+def get_monomer_arrays_update(previous_arrays, new_arrays, tolerance=1e-6):
+    """
+    Get an update for the "monomer_arrays" updater with the ids
+    of deleted particles and the rows of particles that are new
+    or whose type, neighbors or position (within tolerance) changed
+    """
+    previous_ids = previous_arrays["ids"]
+    new_ids = new_arrays["ids"]
+    previous_indices = np.full(len(new_ids), -1)
+    if len(previous_ids) > 0 and len(new_ids) > 0:
+        sorter = np.argsort(previous_ids)
+        found = np.minimum(
+            np.searchsorted(previous_ids, new_ids, sorter=sorter), len(sorter) - 1
+        )
+        matches = previous_ids[sorter[found]] == new_ids
+        previous_indices[matches] = sorter[found[matches]]
+    existed = previous_indices >= 0
+    changed = ~existed
+    old = previous_indices[existed]
+    changed[existed] = np.any(
+        np.abs(new_arrays["positions"][existed] - previous_arrays["positions"][old])
+        > tolerance,
+        axis=1,
+    ) | (
+        np.array(previous_arrays["type_names"], dtype=object)[
+            previous_arrays["type_codes"][old]
+        ]
+        != np.array(new_arrays["type_names"], dtype=object)[
+            new_arrays["type_codes"][existed]
+        ]
+    )
+    new_indices = np.flatnonzero(existed)
+    width = max(
+        np.max(_get_neighbor_counts(previous_arrays, old), initial=0),
+        np.max(_get_neighbor_counts(new_arrays, new_indices), initial=0),
+    )
+    changed[existed] |= np.any(
+        _get_padded_neighbor_ids(previous_arrays, old, width)
+        != _get_padded_neighbor_ids(new_arrays, new_indices, width),
+        axis=1,
+    )
+    return {
+        "_delete": previous_ids[~np.isin(previous_ids, new_ids)],
+        "_add": get_monomer_arrays_subset(new_arrays, np.flatnonzero(changed)),
+        "topologies": new_arrays["topologies"],
+    }
+
+
+def update_monomer_arrays(current_value, update):
+    """
+    Updater for columnar monomer arrays, replacing them with full
+    monomer arrays, or deleting the particles with ids in "_delete"
+    and adding or replacing the rows in "_add"
+    """
+    if "ids" in update:
+        return update
+    delete_ids = np.asarray(update.get("_delete", []), dtype=int)
+    add_arrays = update.get("_add", get_empty_monomer_arrays())
+    remove_ids = np.concatenate([delete_ids, add_arrays["ids"]])
+    keep = np.flatnonzero(~np.isin(current_value["ids"], remove_ids))
+    return concatenate_monomer_arrays(
+        [get_monomer_arrays_subset(current_value, keep), add_arrays],
+        update.get("topologies", current_value["topologies"]),
+    )
+
+
+def get_monomer_edge_positions(particles):
+    """
+    Get the end positions of each bond between particles once,
+    shaped (edges, 2, 3), in order of first appearance
+    """
+    seen = set()
+    edge_positions = []
+    for particle_id, particle in particles.items():
+        particle_key = str(particle_id)
+        for neighbor_id in particle["neighbor_ids"]:
+            neighbor_key = str(neighbor_id)
+            edge = (
+                (particle_key, neighbor_key)
+                if particle_key <= neighbor_key
+                else (neighbor_key, particle_key)
+            )
+            if edge in seen:
+                continue
+            seen.add(edge)
+            neighbor = (
+                particles[neighbor_id]
+                if neighbor_id in particles
+                else particles[neighbor_key]
+            )
+            edge_positions.append([particle["position"], neighbor["position"]])
+    return np.array(edge_positions, dtype=float).reshape((-1, 2, 3))
+
+
+def get_edge_indices_from_arrays(monomer_arrays):
+    """
+    Get the indices of the two particles in each bond once, shaped (edges, 2),
+    from the CSR neighbor arrays of columnar monomer arrays
+    """
+    neighbor_offsets = monomer_arrays["neighbor_offsets"]
+    neighbor_indices = get_particle_indices(
+        monomer_arrays, monomer_arrays["neighbor_ids"]
+    )
+    particle_indices = np.repeat(
+        np.arange(len(monomer_arrays["ids"])), np.diff(neighbor_offsets)
+    )
+    edges = np.sort(np.column_stack([particle_indices, neighbor_indices]), axis=1)
+    return np.unique(edges, axis=0)
+
+
+def _get_particle_keys(particles):
+    """
+    Map str ids to particle keys, since neighbor ids may be ints or strs
+    """
+    return {str(particle_id): particle_id for particle_id in particles}
+
+
+def _get_monomers_subset(monomers, particles):
+    """
+    Build monomer data for a subset of particles,
+    keeping each topology's particles that are in the subset
+    """
+    kept_ids = set(str(particle_id) for particle_id in particles)
+    topologies = {}
+    for topology_id, topology in monomers["topologies"].items():
+        topologies[topology_id] = {
+            "type_name": topology["type_name"],
+            "particle_ids": [
+                particle_id
+                for particle_id in topology["particle_ids"]
+                if str(particle_id) in kept_ids
+            ],
+        }
+    return {
+        "topologies": topologies,
+        "particles": particles,
+    }
+
+
+def downsample_monomers(monomers, stride):
+    """
+    Keep one particle per stride along each filament, as well as filament ends
+    and branch points, connecting each kept particle to the nearest kept
+    particle on the path back to the start of its filament
+    """
+    if stride <= 1:
+        return monomers
+    particles = monomers["particles"]
+    keys = _get_particle_keys(particles)
+    neighbors = {
+        particle_id: [
+            keys[str(neighbor_id)]
+            for neighbor_id in particle["neighbor_ids"]
+            if str(neighbor_id) in keys
+        ]
+        for particle_id, particle in particles.items()
+    }
+    kept_neighbors = {}
+    visited = set()
+    for particle_id in particles:
+        if particle_id in visited:
+            continue
+        # start from an end of the filament if it has one
+        component = [particle_id]
+        visited.add(particle_id)
+        for current_id in component:
+            for neighbor_id in neighbors[current_id]:
+                if neighbor_id not in visited:
+                    visited.add(neighbor_id)
+                    component.append(neighbor_id)
+        start_id = next(
+            (current_id for current_id in component if len(neighbors[current_id]) < 2),
+            particle_id,
+        )
+        # depth first walk, tracking each particle's nearest kept ancestor
+        walked = {start_id}
+        stack = [(start_id, 0, None)]
+        while stack:
+            current_id, depth, kept_ancestor = stack.pop()
+            if depth % stride == 0 or len(neighbors[current_id]) != 2:
+                kept_neighbors[current_id] = []
+                if kept_ancestor is not None:
+                    kept_neighbors[current_id].append(kept_ancestor)
+                    kept_neighbors[kept_ancestor].append(current_id)
+                kept_ancestor = current_id
+            for neighbor_id in neighbors[current_id]:
+                if neighbor_id not in walked:
+                    walked.add(neighbor_id)
+                    stack.append((neighbor_id, depth + 1, kept_ancestor))
+    downsampled = {}
+    for particle_id, particle in particles.items():
+        if particle_id in kept_neighbors:
+            downsampled[particle_id] = {
+                "type_name": particle["type_name"],
+                "position": particle["position"],
+                "neighbor_ids": kept_neighbors[particle_id],
+            }
+    return _get_monomers_subset(monomers, downsampled)
+
+
+def cull_monomers(monomers, region_center, region_size):
+    """
+    Keep only the particles inside a box region,
+    and the bonds between them
+    """
+    particles = monomers["particles"]
+    if len(particles) == 0:
+        return monomers
+    positions = np.array(
+        [particle["position"] for particle in particles.values()], dtype=float
+    ).reshape((-1, 3))
+    inside = np.all(
+        np.abs(positions - np.asarray(region_center)) <= 0.5 * np.asarray(region_size),
+        axis=1,
+    )
+    kept_ids = set(
+        str(particle_id)
+        for particle_id, is_inside in zip(particles, inside)
+        if is_inside
+    )
+    culled = {}
+    for particle_id, is_inside in zip(particles, inside):
+        if not is_inside:
+            continue
+        particle = particles[particle_id]
+        culled[particle_id] = {
+            "type_name": particle["type_name"],
+            "position": particle["position"],
+            "neighbor_ids": [
+                neighbor_id
+                for neighbor_id in particle["neighbor_ids"]
+                if str(neighbor_id) in kept_ids
+            ],
+        }
+    return _get_monomers_subset(monomers, culled)
+
+
+def _get_linear_chain_particles(n_particles, chain_length=100):
+    particles = {}
+    for particle_id in range(n_particles):
+        neighbor_ids = []
+        if particle_id % chain_length > 0:
+            neighbor_ids.append(particle_id - 1)
+        if (particle_id + 1) % chain_length > 0 and particle_id + 1 < n_particles:
+            neighbor_ids.append(particle_id + 1)
+        particles[particle_id] = {
+            "type_name": "actin",
+            "position": np.array([4.0 * particle_id, 0.0, 0.0]),
+            "neighbor_ids": neighbor_ids,
+        }
+    return particles
+
+
+def _get_edge_positions_from_list(particles):
+    """
+    Deduplicate edges by searching a list, for comparison
+    """
+    edge_ids = []
+    edge_positions = []
+    for particle_id, particle in particles.items():
+        for neighbor_id in particle["neighbor_ids"]:
+            edge = (particle_id, neighbor_id)
+            reverse_edge = (neighbor_id, particle_id)
+            if edge not in edge_ids and reverse_edge not in edge_ids:
+                edge_ids.append(edge)
+                edge_positions.append(
+                    [particle["position"], particles[neighbor_id]["position"]]
+                )
+    return edge_positions
+
+
+def benchmark_monomer_edges(max_list_particles=10000):
+    """
+    Compare the time to find edges between particles in linear chains
+    by searching a list, hashing, or from CSR neighbor arrays
+    """
+    for n_particles in [1000, 10000, 100000]:
+        particles = _get_linear_chain_particles(n_particles)
+        ids = np.array(list(particles.keys()))
+        neighbor_counts = [len(p["neighbor_ids"]) for p in particles.values()]
+        neighbor_offsets = np.zeros(n_particles + 1, dtype=int)
+        np.cumsum(neighbor_counts, out=neighbor_offsets[1:])
+        monomer_arrays = {
+            "ids": ids,
+            "neighbor_offsets": neighbor_offsets,
+            "neighbor_ids": np.array(
+                [i for p in particles.values() for i in p["neighbor_ids"]], dtype=int
+            ),
+        }
+        timings = {}
+        if n_particles <= max_list_particles:
+            start = time.perf_counter()
+            _get_edge_positions_from_list(particles)
+            timings["list"] = time.perf_counter() - start
+        start = time.perf_counter()
+        get_monomer_edge_positions(particles)
+        timings["hashed"] = time.perf_counter() - start
+        start = time.perf_counter()
+        get_edge_indices_from_arrays(monomer_arrays)
+        timings["arrays"] = time.perf_counter() - start
+        print(
+            f"{n_particles} particles: "
+            + ", ".join(f"{name} {seconds:.4f} s" for name, seconds in timings.items())
+        )
+
+
+if __name__ == "__main__":
+    benchmark_monomer_edges()
@@ -0,0 +1,127 @@
+import numpy as np
+
+
+class ParameterSampler:
+    """
+    Generate Scan parameter sets for parameters within bounds,
+    given as {parameter name: (lower bound, upper bound)},
+    using Latin hypercube or Sobol sampling, and refine them adaptively
+    by adding points where a scalar metric changes most
+    """
+
+    def __init__(self, bounds, states, base_parameters=None, seed=None):
+        self.parameter_names = list(bounds.keys())
+        self.lower_bounds = np.array(
+            [bounds[name][0] for name in self.parameter_names], dtype=float
+        )
+        self.upper_bounds = np.array(
+            [bounds[name][1] for name in self.parameter_names], dtype=float
+        )
+        self.states = states
+        self.base_parameters = base_parameters or {}
+        self.rng = np.random.default_rng(seed)
+        self.n_generated = 0
+
+    @property
+    def n_dimensions(self):
+        return len(self.parameter_names)
+
+    def get_parameter_sets(self, unit_points, existing_ids=()):
+        """
+        Scale points in the unit hypercube to parameter sets with new ids,
+        named "sample_<n>" so they don't overwrite ids given by the user,
+        and skipping any in existing_ids
+        """
+        existing_ids = {str(id) for id in existing_ids}
+        points = self.lower_bounds + unit_points * (
+            self.upper_bounds - self.lower_bounds
+        )
+        result = {}
+        for point in points:
+            while f"sample_{self.n_generated}" in existing_ids:
+                self.n_generated += 1
+            parameters = dict(self.base_parameters)
+            parameters.update(zip(self.parameter_names, point.tolist()))
+            result[f"sample_{self.n_generated}"] = {
+                "parameters": parameters,
+                "states": self.states,
+            }
+            self.n_generated += 1
+        return result
+
+    def get_unit_points(self, parameter_sets):
+        """
+        Scale parameter sets to points in the unit hypercube
+        """
+        points = np.array(
+            [
+                [parameter_set["parameters"][name] for name in self.parameter_names]
+                for parameter_set in parameter_sets.values()
+            ],
+            dtype=float,
+        ).reshape((-1, self.n_dimensions))
+        return (points - self.lower_bounds) / (self.upper_bounds - self.lower_bounds)
+
+    def latin_hypercube(self, n_points):
+        """
+        Sample n_points parameter sets with one point
+        in each of n_points equal intervals along every parameter
+        """
+        strata = self.rng.permuted(
+            np.tile(np.arange(n_points), (self.n_dimensions, 1)), axis=1
+        ).T
+        jitter = self.rng.random((n_points, self.n_dimensions))
+        return self.get_parameter_sets((strata + jitter) / n_points)
+
+    def sobol(self, n_points):
+        """
+        Sample n_points parameter sets from a scrambled Sobol sequence,
+        n_points should be a power of 2 for the best balance
+        """
+        try:
+            from scipy.stats import qmc
+        except ImportError:
+            raise ImportError("Sobol sampling requires scipy to be installed")
+        sampler = qmc.Sobol(self.n_dimensions, scramble=True, seed=self.rng)
+        return self.get_parameter_sets(sampler.random(n_points))
+
+    def refine(self, parameter_sets, results, metric_name, n_points):
+        """
+        Add up to n_points parameter sets at the midpoints between
+        neighboring parameter sets whose scalar metric differs the most
+        """
+        ids = [id for id in parameter_sets if id in results]
+        if len(ids) < 2:
+            return {}
+        unit_points = self.get_unit_points({id: parameter_sets[id] for id in ids})
+        values = np.array(
+            [float(results[id]["metrics"][metric_name]) for id in ids], dtype=float
+        )
+        distances = np.linalg.norm(
+            unit_points[:, np.newaxis] - unit_points[np.newaxis], axis=2
+        )
+        n_neighbors = min(2 * self.n_dimensions, len(ids) - 1)
+        neighbors = np.argsort(distances, axis=1)[:, 1 : n_neighbors + 1]
+        edges = np.unique(
+            np.sort(
+                np.column_stack(
+                    [np.repeat(np.arange(len(ids)), n_neighbors), neighbors.ravel()]
+                ),
+                axis=1,
+            ),
+            axis=0,
+        )
+        scores = np.abs(values[edges[:, 0]] - values[edges[:, 1]])
+        midpoints = []
+        for edge_index in np.argsort(-scores, kind="stable"):
+            if len(midpoints) >= n_points:
+                break
+            midpoint = 0.5 * (
+                unit_points[edges[edge_index, 0]] + unit_points[edges[edge_index, 1]]
+            )
+            sampled = np.vstack([unit_points] + midpoints)
+            if np.min(np.linalg.norm(sampled - midpoint, axis=1)) > 1e-9:
+                midpoints.append(midpoint[np.newaxis])
+        if len(midpoints) == 0:
+            return {}
+        return self.get_parameter_sets(np.vstack(midpoints), parameter_sets.keys())
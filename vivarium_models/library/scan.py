@@ -1,27 +1,231 @@
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
 from vivarium.core.engine import Engine
 
 
+def run_simulation(simulator_class, parameter_set, total_time, seed=None):
+    """
+    Run a simulation for one parameter set and return the emitted data
+    """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    simulator = simulator_class(parameter_set["parameters"]).generate()
+    engine = Engine(
+        processes=simulator["processes"],
+        topology=simulator["topology"],
+        initial_state=parameter_set["states"],
+    )
+    engine.update(total_time)
+    return engine.emitter.get_data()
+
+
+def thin_trajectory(data, stride):
+    """
+    Keep every stride-th time point of emitted data, and the last one
+    """
+    times = sorted(data.keys())
+    keep_indices = set(range(0, len(times), stride))
+    keep_indices.add(len(times) - 1)
+    return {times[index]: data[times[index]] for index in sorted(keep_indices)}
+
+
+def run_parameter_set(
+    simulator_class,
+    parameter_set,
+    total_time,
+    metrics,
+    keep_data=False,
+    seed=None,
+    trajectory_stride=0,
+):
+    """
+    Run a simulation for one parameter set and calculate its metrics,
+    defined at module level so it can run in a worker process
+    """
+    data = run_simulation(simulator_class, parameter_set, total_time, seed)
+    result = {"metrics": {name: metric(data) for name, metric in metrics.items()}}
+    if keep_data:
+        result["data"] = data
+    if trajectory_stride > 0 and len(data) > 0:
+        result["trajectory"] = thin_trajectory(data, trajectory_stride)
+    return result
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+class ScanResultsStore:
+    """
+    Append-only JSON lines file of scan results,
+    one line per completed parameter set keyed by its id,
+    which can be read while the scan is still running
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        """
+        Read the results of all completed parameter sets,
+        skipping a last line left incomplete by a crash
+        """
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+        with open(self.path) as results_file:
+            for line in results_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                results[record.pop("id")] = record
+        return results
+
+    def append(self, id, result):
+        line = json.dumps({"id": str(id), **result}, default=_to_json)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a") as results_file:
+            results_file.write(line + "\n")
+            results_file.flush()
+            os.fsync(results_file.fileno())
+
+
 class Scan:
-    def __init__(self, parameter_sets, simulator_class, total_time, metrics=()):
+    """
+    Run a simulation for each parameter set and calculate metrics on the results.
+    With n_workers > 1 the parameter sets are run in a pool of worker processes,
+    so the simulator class and metric functions must be picklable
+    (defined at module level). Only each run's metrics are returned
+    by default, its emitted data too if keep_data is True,
+    which with workers pickles every run's data back to this process.
+    Each run is seeded with the parameter set's "seed" if it has one,
+    otherwise with seed + the parameter set's index if a seed is given.
+    Only Python's and NumPy's global random generators are seeded,
+    so runs are only reproducible for simulators that draw from them:
+    ReaDDy seeds its own C++ generator, so ReaddyActinProcess runs are not
+    With a results_path each run's metrics, and its trajectory thinned
+    to every trajectory_stride-th time point if trajectory_stride > 0,
+    are appended to a ScanResultsStore as soon as the run completes,
+    and parameter sets already in the store are not run again
+    """
+
+    def __init__(
+        self,
+        parameter_sets,
+        simulator_class,
+        total_time,
+        metrics=None,
+        n_workers=1,
+        keep_data=False,
+        seed=None,
+        results_path=None,
+        trajectory_stride=0,
+    ):
         self.parameter_sets = parameter_sets
         self.simulator_class = simulator_class
         self.total_time = total_time
-        self.metrics = metrics
+        self.metrics = metrics or {}
+        self.n_workers = n_workers
+        self.keep_data = keep_data
+        self.seed = seed
+        self.results_store = (
+            ScanResultsStore(results_path) if results_path is not None else None
+        )
+        self.trajectory_stride = trajectory_stride
+        self.results = {}
+
+    def get_seed(self, index, parameter_set):
+        if "seed" in parameter_set:
+            return parameter_set["seed"]
+        if self.seed is not None:
+            return self.seed + index
+        return None
 
     def run_simulation(self, parameters):
-        simulator = self.simulator_class(parameters["parameters"]).generate()
-        engine = Engine(
-            processes=simulator["processes"],
-            topology=simulator["topology"],
-            initial_state=parameters["states"],
-        )
-        engine.update(self.total_time)
-        return engine.emitter.get_data()
+        return run_simulation(self.simulator_class, parameters, self.total_time)
 
     def run_scan(self):
-        results = {}
-        for id, parameter_set in self.parameter_sets.items():
-            data = self.run_simulation(parameter_set)
-            metrics = {name: metric(data) for name, metric in self.metrics.items()}
-            results[id] = {"data": data, "metrics": metrics}
+        completed = {str(id): result for id, result in self.results.items()}
+        if self.results_store is not None:
+            completed.update(self.results_store.read())
+        run_args = {
+            id: (
+                self.simulator_class,
+                parameter_set,
+                self.total_time,
+                self.metrics,
+                self.keep_data,
+                self.get_seed(index, parameter_set),
+                self.trajectory_stride,
+            )
+            for index, (id, parameter_set) in enumerate(self.parameter_sets.items())
+            if str(id) not in completed
+        }
+        new_results = {}
+        if self.n_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                futures = {
+                    executor.submit(run_parameter_set, *args): id
+                    for id, args in run_args.items()
+                }
+                # save every run that completes even if another one fails,
+                # so the results store can resume from all of them
+                error = None
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except Exception as exception:
+                        if error is None:
+                            error = exception
+                        continue
+                    self.save_result(futures[future], result, new_results)
+                if error is not None:
+                    raise error
+        else:
+            for id, args in run_args.items():
+                self.save_result(id, run_parameter_set(*args), new_results)
+        self.results = {
+            id: new_results[id] if id in new_results else completed[str(id)]
+            for id in self.parameter_sets
+        }
+        return self.results
+
+    def run_adaptive_scan(self, sampler, metric_name, n_rounds, n_points_per_round):
+        """
+        Run the scan, then for each round add parameter sets from
+        a ParameterSampler where the scalar metric changes most and run those
+        """
+        results = self.run_scan()
+        for _ in range(n_rounds):
+            new_parameter_sets = sampler.refine(
+                self.parameter_sets, results, metric_name, n_points_per_round
+            )
+            if len(new_parameter_sets) == 0:
+                break
+            existing_ids = set(new_parameter_sets) & set(self.parameter_sets)
+            if existing_ids:
+                raise ValueError(f"sampled parameter set ids {existing_ids} exist")
+            self.parameter_sets.update(new_parameter_sets)
+            results = self.run_scan()
         return results
+
+    def save_result(self, id, result, results):
+        results[id] = result
+        if self.results_store is not None:
+            self.results_store.append(
+                id, {key: value for key, value in result.items() if key != "data"}
+            )
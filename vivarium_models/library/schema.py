@@ -1,25 +1,109 @@
+import time
+from functools import lru_cache
+
 import numpy as np
 
+from vivarium_models.library.monomers import get_empty_monomer_arrays
+
+# Schemas are built once for each set of arguments and shared between
+# every process that asks for them, so they must be treated as read only.
+# Vivarium deep copies ports_schema() in Process.get_schema
+# before merging overrides or building stores from it
+
 
-def fibers_schema():
+def _set_leaf(default):
     return {
-        "fibers_box_extent": {
-            "_default": np.array([4000.0, 2000.0, 2000.0]),
-            "_updater": "set",
-            "_emit": True,
-        },
+        "_default": default,
+        "_updater": "set",
+        "_emit": True,
+    }
+
+
+@lru_cache(maxsize=None)
+def fibers_schema(box_extent=True):
+    """
+    Schema for the fibers port, and the fibers_box_extent port
+    unless box_extent is False
+    """
+    schema = {
         "fibers": {
             "*": {
-                "type_name": {
-                    "_default": "",
-                    "_updater": "set",
-                    "_emit": True,
-                },
-                "points": {  # list of shape (3) numpy arrays
-                    "_default": [],
-                    "_updater": "set",
-                    "_emit": True,
-                },
+                "type_name": _set_leaf(""),
+                "points": _set_leaf(np.zeros((0, 3))),  # (n_points, 3) array
+                # id of the mother fiber of a daughter, or -1,
+                # MonomerToFiber keys fibers by their pointed end particle's id
+                "parent_id": _set_leaf(-1),
+                "branch_point": _set_leaf(np.zeros(3)),
             }
         },
     }
+    if box_extent:
+        schema["fibers_box_extent"] = _set_leaf(np.array([4000.0, 2000.0, 2000.0]))
+    return schema
+
+
+@lru_cache(maxsize=None)
+def monomers_schema(compact=False, box=True, observe_schedule=False):
+    """
+    Schema for the monomers port, with the monomer box unless box is False
+    and ReaDDy's observe_schedule if observe_schedule is True.
+    Compact monomers are stored as one leaf of columnar monomer arrays
+    instead of a store per particle, updated by the "monomer_arrays" updater
+    """
+    schema = {}
+    if box:
+        schema["box_center"] = _set_leaf(np.array([1000.0, 0.0, 0.0]))
+        schema["box_size"] = _set_leaf(500.0)
+    if observe_schedule:
+        schema["observe_schedule"] = _set_leaf({})
+    if compact:
+        schema["monomer_arrays"] = {
+            "_default": get_empty_monomer_arrays(),
+            "_updater": "monomer_arrays",
+            "_emit": True,
+        }
+        return schema
+    schema["topologies"] = {
+        "*": {
+            "type_name": _set_leaf(""),
+            "particle_ids": _set_leaf([]),
+        }
+    }
+    schema["particles"] = {
+        "*": {
+            "type_name": _set_leaf(""),
+            "position": _set_leaf(np.zeros(3)),
+            "neighbor_ids": _set_leaf([]),
+        }
+    }
+    return schema
+
+
+def benchmark_schemas(n_processes=100):
+    """
+    Compare getting the schemas of n_processes each of MonomerToFiber,
+    FiberToMonomer and VisualizeMonomer, as vivarium does
+    when it builds a composite, with and without the cache
+    """
+    from vivarium_models.processes.fiber_to_monomer import FiberToMonomer
+    from vivarium_models.processes.monomer_to_fiber import MonomerToFiber
+    from vivarium_models.processes.visualize_monomer import VisualizeMonomer
+
+    processes = []
+    for _ in range(n_processes):
+        processes += [MonomerToFiber(), FiberToMonomer(), VisualizeMonomer()]
+    for cached in [False, True]:
+        start = time.perf_counter()
+        for process in processes:
+            if not cached:
+                fibers_schema.cache_clear()
+                monomers_schema.cache_clear()
+            process.ports()
+            process.get_schema()
+        seconds = time.perf_counter() - start
+        label = "cached" if cached else "uncached"
+        print(f"{label}: {1000 * seconds:.1f} ms for {len(processes)} processes")
+
+
+if __name__ == "__main__":
+    benchmark_schemas()
@@ -0,0 +1,287 @@
+import io
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+from simulariumio import TrajectoryConverter, TrajectoryData, MetaData, UnitData
+from simulariumio.constants import DEFAULT_CAMERA_SETTINGS
+
+from vivarium_models.library.trajectory import TrajectoryBuffer
+
+# values per agent in a Simularium frame before its subpoints:
+# viz type, unique id, type id, position (3), rotation (3), radius, n subpoints
+AGENT_VALUES = 11
+
+# the float32 format is an internal cache format, smaller and faster to write
+# than json, that the Simularium viewer can't open, read it back with
+# read_float32. It is FLOAT32_MAGIC, then for each frame its number of values
+# as uint32 followed by the values as float32, then the trajectory info as JSON,
+# its length in bytes as uint64 and FLOAT32_MAGIC again
+FLOAT32_MAGIC = b"SIMF32\x00\x01"
+FILE_EXTENSIONS = {"json": ".simularium", "float32": ".simf32"}
+
+
+def get_frame_values(trajectory, frame, type_ids, scale_factor, display_types=None):
+    """
+    Flatten one frame of a TrajectoryBuffer into Simularium's per agent layout,
+    adding any new type names to type_ids, and their display type
+    ("FIBER" for agents with subpoints, otherwise "SPHERE") to display_types
+    """
+    n_agents = trajectory.n_agents[frame]
+    n_subpoints = trajectory.n_subpoints[frame, :n_agents]
+    type_codes = np.zeros(n_agents)
+    for index, type_name in enumerate(trajectory.types[frame]):
+        if type_name not in type_ids:
+            type_ids[type_name] = len(type_ids)
+            if display_types is not None:
+                display_types[type_name] = (
+                    "FIBER" if n_subpoints[index] > 0 else "SPHERE"
+                )
+        type_codes[index] = type_ids[type_name]
+    agent_values = np.zeros((n_agents, AGENT_VALUES))
+    agent_values[:, 0] = trajectory.viz_types[frame, :n_agents]
+    agent_values[:, 1] = trajectory.unique_ids[frame, :n_agents]
+    agent_values[:, 2] = type_codes
+    agent_values[:, 3:6] = scale_factor * trajectory.positions[frame, :n_agents]
+    agent_values[:, 9] = scale_factor * trajectory.radii[frame, :n_agents]
+    agent_values[:, 10] = 3 * n_subpoints
+    # place each agent's values followed by its subpoints in one flat array
+    n_values = AGENT_VALUES + 3 * n_subpoints
+    offsets = np.zeros(n_agents, dtype=int)
+    np.cumsum(n_values[:-1], out=offsets[1:])
+    result = np.zeros(np.sum(n_values))
+    result[offsets[:, np.newaxis] + np.arange(AGENT_VALUES)] = agent_values
+    subpoints = trajectory.subpoints[frame, :n_agents]
+    subpoint_values = scale_factor * subpoints.reshape(
+        (n_agents, 3 * subpoints.shape[1])
+    )
+    for value_index in range(3 * np.max(n_subpoints, initial=0)):
+        has_value = 3 * n_subpoints > value_index
+        result[offsets[has_value] + AGENT_VALUES + value_index] = subpoint_values[
+            has_value, value_index
+        ]
+    return result
+
+
+def get_xyz(vector):
+    """
+    Get a 3D vector as a Simularium {"x", "y", "z"} dict
+    """
+    return {"x": float(vector[0]), "y": float(vector[1]), "z": float(vector[2])}
+
+
+def get_temp_path(path):
+    """
+    Get a unique temporary path in the same directory as path,
+    creating the directory if needed, so the finished file
+    can be moved to path atomically with os.replace
+    """
+    directory, name = os.path.split(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex}.tmp")
+
+
+class SimulariumStreamWriter:
+    """
+    Write Simularium frames one chunk at a time,
+    so only the frames not yet written need to be kept in memory.
+    The output format is Simularium "json", or "float32" (see FLOAT32_MAGIC).
+    The trajectory info, which depends on every frame, is written on close,
+    then the file is moved from a temporary path to its final path,
+    so nothing is at the final path until close is called
+    """
+
+    def __init__(self, path, scale_factor=1.0, output_format="json", output_file=None):
+        if output_format not in FILE_EXTENSIONS:
+            raise ValueError(f"unknown Simularium output format {output_format}")
+        self.output_format = output_format
+        self.scale_factor = scale_factor
+        self.n_frames = 0
+        self.type_ids = {}
+        self.display_types = {}
+        self.owns_file = output_file is None
+        if self.owns_file:
+            self.path = path + FILE_EXTENSIONS[output_format]
+            self.temp_path = get_temp_path(self.path)
+            output_file = open(self.temp_path, "w" if output_format == "json" else "wb")
+        self.file = output_file
+        if output_format == "json":
+            self.file.write('{"spatialData": {"bundleData": [')
+        else:
+            self.file.write(FLOAT32_MAGIC)
+
+    def write_frames(self, trajectory):
+        """
+        Append the frames in a TrajectoryBuffer
+        """
+        for frame in range(trajectory.n_frames):
+            values = get_frame_values(
+                trajectory, frame, self.type_ids, self.scale_factor, self.display_types
+            )
+            if self.output_format == "json":
+                if self.n_frames > 0:
+                    self.file.write(", ")
+                self.file.write(
+                    json.dumps(
+                        {
+                            "frameNumber": self.n_frames,
+                            "time": float(self.n_frames),
+                            "data": values.tolist(),
+                        }
+                    )
+                )
+            else:
+                self.file.write(np.uint32(len(values)).tobytes())
+                self.file.write(values.astype(np.float32).tobytes())
+            self.n_frames += 1
+        self.file.flush()
+
+    def get_trajectory_info(self, box_dimensions):
+        """
+        Get the trajectory info with the same fields
+        as simulariumio's JSON writer, using its default camera
+        """
+        box_size = self.scale_factor * (
+            np.zeros(3) if box_dimensions is None else np.array(box_dimensions)
+        )
+        return {
+            "version": 3,
+            "timeUnits": {"magnitude": 1.0, "name": "count"},
+            "timeStepSize": 1.0,
+            "totalSteps": self.n_frames,
+            "spatialUnits": {"magnitude": 1.0 / self.scale_factor, "name": "nm"},
+            "size": get_xyz(box_size),
+            "cameraDefault": {
+                "position": get_xyz(DEFAULT_CAMERA_SETTINGS.CAMERA_POSITION),
+                "lookAtPosition": get_xyz(DEFAULT_CAMERA_SETTINGS.LOOK_AT_POSITION),
+                "upVector": get_xyz(DEFAULT_CAMERA_SETTINGS.UP_VECTOR),
+                "fovDegrees": float(DEFAULT_CAMERA_SETTINGS.FOV_DEGREES),
+            },
+            "typeMapping": {
+                str(type_id): {
+                    "name": type_name,
+                    "geometry": {"displayType": self.display_types[type_name]},
+                }
+                for type_name, type_id in self.type_ids.items()
+            },
+        }
+
+    def close(self, box_dimensions):
+        """
+        Finish the file with the trajectory info
+        """
+        trajectory_info = json.dumps(self.get_trajectory_info(box_dimensions))
+        if self.output_format == "json":
+            self.file.write(
+                '], "version": 1, "msgType": 1, "bundleStart": 0, '
+                f'"bundleSize": {self.n_frames}}}, '
+                f'"trajectoryInfo": {trajectory_info}, '
+                '"plotData": {"version": 1, "data": []}}'
+            )
+        else:
+            info_bytes = trajectory_info.encode("utf-8")
+            self.file.write(info_bytes)
+            self.file.write(np.uint64(len(info_bytes)).tobytes())
+            self.file.write(FLOAT32_MAGIC)
+        if self.owns_file:
+            self.file.close()
+            os.replace(self.temp_path, self.path)
+
+
+def get_float32_bytes(trajectory, box_dimensions, scale_factor=1.0):
+    """
+    Get the frames in a TrajectoryBuffer in the float32 format
+    """
+    output_file = io.BytesIO()
+    writer = SimulariumStreamWriter(
+        None, scale_factor, "float32", output_file=output_file
+    )
+    writer.write_frames(trajectory)
+    writer.close(box_dimensions)
+    return output_file.getvalue()
+
+
+def get_simularium_output(trajectory, box_dimensions, output_format="json"):
+    """
+    Convert the frames in a TrajectoryBuffer to Simularium JSON
+    or to float32 format bytes
+    """
+    if output_format == "float32":
+        return get_float32_bytes(trajectory, box_dimensions)
+    return TrajectoryConverter(
+        TrajectoryData(
+            meta_data=MetaData(
+                box_size=box_dimensions,
+            ),
+            agent_data=trajectory.get_agent_data(),
+            time_units=UnitData("ns"),  # nanoseconds
+            spatial_units=UnitData("nm"),  # nanometers
+        )
+    ).to_JSON()
+
+
+def read_float32(data):
+    """
+    Read the trajectory info and each frame's values from float32 format bytes
+    """
+    magic_size = len(FLOAT32_MAGIC)
+    if data[:magic_size] != FLOAT32_MAGIC or data[-magic_size:] != FLOAT32_MAGIC:
+        raise ValueError("not Simularium float32 data")
+    info_size = int(np.frombuffer(data[-magic_size - 8 : -magic_size], np.uint64)[0])
+    info_start = len(data) - magic_size - 8 - info_size
+    trajectory_info = json.loads(data[info_start : info_start + info_size])
+    frames = []
+    offset = magic_size
+    while offset < info_start:
+        n_values = int(np.frombuffer(data[offset : offset + 4], np.uint32)[0])
+        offset += 4
+        frames.append(np.frombuffer(data, np.float32, n_values, offset))
+        offset += 4 * n_values
+    return trajectory_info, frames
+
+
+def benchmark_output_formats(n_frames=20, n_monomers=10000, path="out/benchmark"):
+    """
+    Compare write time and file size of the json and float32 formats
+    for a trajectory of actin monomers with an edge between each neighbor
+    """
+    rng = np.random.default_rng(0)
+    trajectory = TrajectoryBuffer()
+    n_edges = n_monomers - 1
+    n_agents = n_monomers + n_edges
+    for _ in range(n_frames):
+        # a helix like an actin filament, jiggled each frame
+        angles = np.arange(n_monomers) * np.deg2rad(166.6)
+        positions = np.column_stack(
+            [2.75 * np.arange(n_monomers), 3 * np.cos(angles), 3 * np.sin(angles)]
+        ) + rng.normal(scale=0.5, size=(n_monomers, 3))
+        subpoints = np.zeros((n_agents, 2, 3))
+        subpoints[n_monomers:, 0] = positions[:-1]
+        subpoints[n_monomers:, 1] = positions[1:]
+        n_subpoints = np.zeros(n_agents, dtype=int)
+        n_subpoints[n_monomers:] = 2
+        trajectory.add_frame(
+            np.arange(n_agents),
+            n_monomers * ["actin#ATP_1"] + n_edges * ["edge"],
+            np.concatenate([np.full(n_monomers, 1000.0), np.full(n_edges, 1001.0)]),
+            np.vstack([positions, np.zeros((n_edges, 3))]),
+            np.concatenate([np.full(n_monomers, 2.0), np.full(n_edges, 1.0)]),
+            n_subpoints,
+            subpoints,
+        )
+    box_dimensions = np.array([3 * n_monomers, 100.0, 100.0])
+    for output_format in FILE_EXTENSIONS:
+        start = time.perf_counter()
+        writer = SimulariumStreamWriter(path, 0.1, output_format)
+        writer.write_frames(trajectory)
+        writer.close(box_dimensions)
+        seconds = time.perf_counter() - start
+        size = os.path.getsize(writer.path) / 1e6
+        print(f"{output_format}: {seconds:.2f} s, {size:.1f} MB")
+
+
+if __name__ == "__main__":
+    benchmark_output_formats()
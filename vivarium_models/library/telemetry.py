@@ -0,0 +1,61 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LoopTelemetry:
+    """
+    Periodic progress summaries for a simulation loop.
+    Silent by default, when an interval is given it reports
+    steps per second every interval steps, to the callback if there is one,
+    otherwise to the log
+    """
+
+    def __init__(self, name, interval=0, callback=None):
+        self.name = name
+        self.interval = interval
+        self.callback = callback
+        self.n_steps = 0
+        self.start_time = 0.0
+
+    @property
+    def enabled(self):
+        return self.interval is not None and self.interval > 0
+
+    def get_chunks(self, n_steps):
+        """
+        Get (first step, last step) ranges to run between reports,
+        a single range covering all steps when reporting is disabled
+        """
+        if not self.enabled:
+            return [(1, n_steps)]
+        return [
+            (first_step, min(first_step + self.interval - 1, n_steps))
+            for first_step in range(1, n_steps + 1, self.interval)
+        ]
+
+    def start(self, n_steps):
+        if not self.enabled:
+            return
+        self.n_steps = n_steps
+        self.start_time = time.perf_counter()
+
+    def report(self, step):
+        if not self.enabled:
+            return
+        elapsed = time.perf_counter() - self.start_time
+        summary = {
+            "name": self.name,
+            "step": step,
+            "n_steps": self.n_steps,
+            "elapsed": elapsed,
+            "steps_per_second": step / elapsed if elapsed > 0 else float("inf"),
+        }
+        if self.callback is not None:
+            self.callback(summary)
+        else:
+            logger.info(
+                f"{self.name}: step {step} / {self.n_steps}, "
+                f"{summary['steps_per_second']:.1f} steps/s"
+            )
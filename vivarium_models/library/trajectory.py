@@ -0,0 +1,102 @@
+import numpy as np
+from simulariumio import AgentData
+
+
+def _grow(array, shape, fill=0):
+    """
+    Copy an array into a larger array padded with the fill value
+    """
+    result = np.full(shape, fill, dtype=array.dtype)
+    result[tuple(slice(0, size) for size in array.shape)] = array
+    return result
+
+
+class TrajectoryBuffer:
+    """
+    Padded NumPy buffers of Simularium agent data,
+    shaped (frames, agents, ...) and grown geometrically
+    as frames with more agents or subpoints are added
+    """
+
+    def __init__(self, frames=16, agents=16, subpoints=2):
+        self.n_frames = 0
+        self.max_agents = 0
+        self.max_subpoints = 0
+        self.n_agents = np.zeros(frames, dtype=int)
+        self.viz_types = np.full((frames, agents), 1000.0)
+        self.unique_ids = np.zeros((frames, agents), dtype=int)
+        self.types = []
+        self.positions = np.zeros((frames, agents, 3))
+        self.radii = np.zeros((frames, agents))
+        self.n_subpoints = np.zeros((frames, agents), dtype=int)
+        self.subpoints = np.zeros((frames, agents, subpoints, 3))
+
+    def reserve(self, n_agents, n_subpoints):
+        """
+        Make sure there is room for one more frame
+        with n_agents agents that have up to n_subpoints subpoints each
+        """
+        frames, agents, subpoints = self.subpoints.shape[:3]
+        new_frames = max(frames, 1)
+        while new_frames <= self.n_frames:
+            new_frames *= 2
+        new_agents = max(agents, 1)
+        while new_agents < n_agents:
+            new_agents *= 2
+        new_subpoints = max(subpoints, 1)
+        while new_subpoints < n_subpoints:
+            new_subpoints *= 2
+        if (new_frames, new_agents, new_subpoints) == (frames, agents, subpoints):
+            return
+        self.n_agents = _grow(self.n_agents, (new_frames,))
+        self.viz_types = _grow(self.viz_types, (new_frames, new_agents), 1000.0)
+        self.unique_ids = _grow(self.unique_ids, (new_frames, new_agents))
+        self.positions = _grow(self.positions, (new_frames, new_agents, 3))
+        self.radii = _grow(self.radii, (new_frames, new_agents))
+        self.n_subpoints = _grow(self.n_subpoints, (new_frames, new_agents))
+        self.subpoints = _grow(
+            self.subpoints, (new_frames, new_agents, new_subpoints, 3)
+        )
+
+    def add_frame(
+        self, unique_ids, types, viz_types, positions, radii, n_subpoints, subpoints
+    ):
+        """
+        Add a frame of agents, where subpoints is shaped
+        (agents, max subpoints, 3) and padded with zeros
+        """
+        n_agents = len(unique_ids)
+        max_subpoints = subpoints.shape[1]
+        self.reserve(n_agents, max_subpoints)
+        frame = self.n_frames
+        self.n_agents[frame] = n_agents
+        self.viz_types[frame, :n_agents] = viz_types
+        self.unique_ids[frame, :n_agents] = unique_ids
+        self.types.append(list(types))
+        self.positions[frame, :n_agents] = positions
+        self.radii[frame, :n_agents] = radii
+        self.n_subpoints[frame, :n_agents] = n_subpoints
+        self.subpoints[frame, :n_agents, :max_subpoints] = subpoints
+        self.max_agents = max(self.max_agents, n_agents)
+        self.max_subpoints = max(self.max_subpoints, max_subpoints)
+        self.n_frames += 1
+
+    def get_agent_data(self, scale_factor=1.0) -> AgentData:
+        """
+        Trim the buffers to the frames and agents added
+        and shape them into a Simularium AgentData object
+        """
+        frames = self.n_frames
+        agents = self.max_agents
+        return AgentData(
+            times=np.arange(frames),
+            n_agents=self.n_agents[:frames].copy(),
+            viz_types=self.viz_types[:frames, :agents].copy(),
+            unique_ids=self.unique_ids[:frames, :agents].copy(),
+            types=self.types,
+            positions=scale_factor * self.positions[:frames, :agents],
+            radii=scale_factor * self.radii[:frames, :agents],
+            n_subpoints=self.n_subpoints[:frames, :agents].copy(),
+            subpoints=scale_factor
+            * self.subpoints[:frames, :agents, : self.max_subpoints],
+        )
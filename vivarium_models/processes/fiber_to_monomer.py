@@ -1,117 +1,200 @@
+import logging
+
 import numpy as np
 
 from vivarium.core.process import Deriver
 from vivarium.core.engine import Engine, pf
 
 from simularium_readdy_models.actin import ActinGenerator, ActinTestData, FiberData
+from ..library.fibers import FiberIndex, normalize_fibers
+from ..library.monomers import (
+    concatenate_monomer_arrays,
+    get_monomer_arrays,
+    get_monomer_arrays_update,
+    get_particle_indices,
+)
+from ..library.schema import fibers_schema, monomers_schema
 from ..util import create_monomer_update
 
+logger = logging.getLogger(__name__)
+
 
 class FiberToMonomer(Deriver):
-    defaults = {}
+    defaults = {
+        # nm, fibers are only regenerated when their points move
+        # to a different multiple of tolerance or the monomer box changes,
+        # or when they move at all if tolerance is 0
+        "tolerance": 1.0,
+        # write monomers as one leaf of columnar monomer arrays
+        "compact_monomers": False,
+    }
 
     def __init__(self, parameters=None):
         super().__init__(parameters)
+        if self.parameters["tolerance"] < 0:
+            raise ValueError("FiberToMonomer tolerance can't be negative")
+        # the monomers generated for each fiber, keyed by fiber id
+        self.segments = {}
+        self.next_particle_id = 0
+        self.next_topology_id = 0
 
     def ports_schema(self):
         return {
-            "fibers_box_extent": {
-                "_default": np.array([4000.0, 2000.0, 2000.0]),
-                "_updater": "set",
-                "_emit": True,
-            },
-            "fibers": {
-                "*": {
-                    "type_name": {
-                        "_default": "",
-                        "_updater": "set",
-                        "_emit": True,
-                    },
-                    "points": {
-                        "_default": [],
-                        "_updater": "set",
-                        "_emit": True,
-                    },
-                }
-            },
-            "monomers": {
-                "box_center": {
-                    "_default": np.array([1000.0, 0.0, 0.0]),
-                    "_updater": "set",
-                    "_emit": True,
-                },
-                "box_size": {
-                    "_default": 500.0,
-                    "_updater": "set",
-                    "_emit": True,
-                },
-                "topologies": {
-                    "*": {
-                        "type_name": {
-                            "_default": "",
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                        "particle_ids": {
-                            "_default": [],
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                    }
-                },
-                "particles": {
-                    "*": {
-                        "type_name": {
-                            "_default": "",
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                        "position": {
-                            "_default": np.zeros(3),
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                        "neighbor_ids": {
-                            "_default": [],
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                    }
-                },
-            },
+            **fibers_schema(),
+            "monomers": monomers_schema(compact=self.parameters["compact_monomers"]),
         }
 
     def next_update(self, timestep, states):
-        print("in fiber to monomer deriver next update")
+        logger.debug("in fiber to monomer deriver next update")
 
-        fiber_data = states["fibers"]
+        fiber_data = normalize_fibers(states["fibers"])
         previous_monomers = states["monomers"]
         monomer_box_center = previous_monomers["box_center"]
         monomer_box_size = previous_monomers["box_size"]
 
-        fibers = [
-            FiberData(fiber_id, fiber_data[fiber_id]["points"])
-            for fiber_id in fiber_data
-            if len(fiber_data[fiber_id]["points"]) > 1
-        ]
-
-        fiber_monomers = ActinGenerator.get_monomers(
-            fibers, monomer_box_center, monomer_box_size, use_uuids=False
+        # only generate monomers for fibers with a segment in the monomer box
+        fiber_index = FiberIndex(fiber_data)
+        fiber_ids = fiber_index.query_box(
+            monomer_box_center - monomer_box_size / 2.0,
+            monomer_box_center + monomer_box_size / 2.0,
         )
-        for particle_id in fiber_monomers["particles"]:
-            fiber_monomers["particles"][particle_id] = dict(
-                fiber_monomers["particles"][particle_id]
+
+        segments = {}
+        for fiber_id in fiber_ids:
+            points = fiber_data[fiber_id]["points"]
+            key = self.get_segment_key(points, monomer_box_center, monomer_box_size)
+            segment = self.segments.get(fiber_id)
+            if segment is None or segment["key"] != key:
+                segment = self.generate_segment(
+                    fiber_id, points, monomer_box_center, monomer_box_size, segment
+                )
+                segment["key"] = key
+            segments[fiber_id] = segment
+        self.segments = segments
+
+        if self.parameters["compact_monomers"]:
+            monomer_arrays = concatenate_monomer_arrays(
+                [segment["monomer_arrays"] for segment in segments.values()]
             )
+            return {
+                "monomers": {
+                    "monomer_arrays": get_monomer_arrays_update(
+                        previous_monomers["monomer_arrays"], monomer_arrays
+                    )
+                }
+            }
+        fiber_monomers = {"topologies": {}, "particles": {}}
+        for segment in segments.values():
+            fiber_monomers["topologies"].update(segment["topologies"])
+            fiber_monomers["particles"].update(segment["particles"])
 
         return create_monomer_update(previous_monomers, fiber_monomers)
 
+    def get_segment_key(self, points, box_center, box_size):
+        """
+        Key a fiber's monomers by its points rounded to the tolerance
+        and the monomer box
+        """
+        tolerance = self.parameters["tolerance"]
+        if tolerance > 0:
+            quantized = np.round(points / tolerance).astype(int)
+        else:
+            quantized = np.asarray(points, dtype=float)
+        return (
+            tuple(np.asarray(box_center, dtype=float).tolist()),
+            float(box_size),
+            quantized.shape,
+            quantized.tobytes(),
+        )
+
+    def generate_segment(self, fiber_id, points, box_center, box_size, previous):
+        """
+        Generate the monomers for one fiber, reusing the particle and topology
+        ids of its previous monomers if there are enough of them
+        so that ids stay the same as the fiber changes
+        """
+        monomers = ActinGenerator.get_monomers(
+            [FiberData(fiber_id, points)], box_center, box_size, use_uuids=False
+        )
+        # ActinGenerator shares its particles dict between calls,
+        # so drop leftover particles from earlier fibers
+        particle_ids = set()
+        for topology in monomers["topologies"].values():
+            particle_ids.update(topology["particle_ids"])
+        monomers["particles"] = {
+            particle_id: particle
+            for particle_id, particle in monomers["particles"].items()
+            if particle_id in particle_ids
+        }
+        monomer_arrays = get_monomer_arrays(monomers)
+        n_particles = len(monomer_arrays["ids"])
+        n_topologies = len(monomer_arrays["topologies"])
+        if previous is not None and n_particles <= previous["particle_capacity"]:
+            particle_base = previous["particle_base"]
+            particle_capacity = previous["particle_capacity"]
+        else:
+            particle_base = self.next_particle_id
+            particle_capacity = n_particles
+            self.next_particle_id += n_particles
+        if previous is not None and n_topologies <= len(previous["topology_ids"]):
+            topology_ids = previous["topology_ids"]
+        else:
+            topology_ids = list(
+                range(self.next_topology_id, self.next_topology_id + n_topologies)
+            )
+            self.next_topology_id += n_topologies
+        # renumber particles from particle_base in the order they were generated
+        topologies = {}
+        for topology_id, topology in zip(
+            topology_ids, monomer_arrays["topologies"].values()
+        ):
+            topologies[topology_id] = {
+                "type_name": topology["type_name"],
+                "particle_ids": (
+                    particle_base
+                    + get_particle_indices(monomer_arrays, topology["particle_ids"])
+                ).tolist(),
+            }
+        monomer_arrays = {
+            **monomer_arrays,
+            "ids": particle_base + np.arange(n_particles),
+            "neighbor_ids": particle_base
+            + get_particle_indices(monomer_arrays, monomer_arrays["neighbor_ids"]),
+            "topologies": topologies,
+        }
+        segment = {
+            "particle_base": particle_base,
+            "particle_capacity": particle_capacity,
+            "topology_ids": topology_ids,
+            "topologies": topologies,
+        }
+        if self.parameters["compact_monomers"]:
+            segment["monomer_arrays"] = monomer_arrays
+            return segment
+        neighbor_ids = monomer_arrays["neighbor_ids"]
+        neighbor_offsets = monomer_arrays["neighbor_offsets"]
+        type_names = monomer_arrays["type_names"]
+        type_codes = monomer_arrays["type_codes"]
+        positions = monomer_arrays["positions"]
+        particles = {}
+        for index in range(n_particles):
+            particles[particle_base + index] = {
+                "type_name": type_names[type_codes[index]],
+                "position": positions[index],
+                "neighbor_ids": neighbor_ids[
+                    neighbor_offsets[index] : neighbor_offsets[index + 1]
+                ].tolist(),
+            }
+        segment["particles"] = particles
+        return segment
+
 
 def get_initial_fiber_data():
     fibers = ActinTestData.linear_actin_fiber()
     fibers_dict = {}
     for fiber in fibers:
         fibers_dict[fiber.fiber_id] = dict(fiber)
-    return fibers_dict
+    return normalize_fibers(fibers_dict)
 
 
 def test_fiber_to_monomer():
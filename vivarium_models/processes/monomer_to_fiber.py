@@ -1,95 +1,63 @@
+import logging
+
 import numpy as np
 
 from vivarium.core.process import Deriver
 from vivarium.core.engine import Engine, pf
-from simularium_readdy_models.actin import ActinUtil, ActinTestData
-
+from simularium_readdy_models.actin import ActinTestData
+
+from ..library.fibers import (
+    get_actin_chains,
+    get_fiber_end_points,
+    get_fiber_polylines,
+)
+from ..library.monomers import get_monomers_from_arrays
+from ..library.schema import fibers_schema, monomers_schema
 from ..util import agents_update
 
+logger = logging.getLogger(__name__)
+
 
 class MonomerToFiber(Deriver):
-    defaults = {}
+    defaults = {
+        # "ends" for fibers with only their two end points,
+        # or "polyline" for points along the axis that follow its curvature,
+        # kept within tolerance (nm) of the axis or limited to max_points
+        "fiber_points": "ends",
+        "tolerance": 1.0,
+        "max_points": None,
+        # read monomers stored as one leaf of columnar monomer arrays
+        "compact_monomers": False,
+    }
 
     def __init__(self, parameters=None):
         super().__init__(parameters)
 
     def ports_schema(self):
         return {
-            "fibers_box_extent": {
-                "_default": np.array([4000.0, 2000.0, 2000.0]),
-                "_updater": "set",
-                "_emit": True,
-            },
-            "fibers": {
-                "*": {
-                    "type_name": {
-                        "_default": "",
-                        "_updater": "set",
-                        "_emit": True,
-                    },
-                    "points": {
-                        "_default": [],
-                        "_updater": "set",
-                        "_emit": True,
-                    },
-                }
-            },
-            "monomers": {
-                "box_center": {
-                    "_default": np.array([1000.0, 0.0, 0.0]),
-                    "_updater": "set",
-                    "_emit": True,
-                },
-                "box_size": {
-                    "_default": 500.0,
-                    "_updater": "set",
-                    "_emit": True,
-                },
-                "topologies": {
-                    "*": {
-                        "type_name": {
-                            "_default": "",
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                        "particle_ids": {
-                            "_default": [],
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                    }
-                },
-                "particles": {
-                    "*": {
-                        "type_name": {
-                            "_default": "",
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                        "position": {
-                            "_default": np.zeros(3),
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                        "neighbor_ids": {
-                            "_default": [],
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                    }
-                },
-            },
+            **fibers_schema(),
+            "monomers": monomers_schema(compact=self.parameters["compact_monomers"]),
         }
 
     def next_update(self, timestep, states):
-        print("in monomer to fiber deriver next update")
+        logger.debug("in monomer to fiber deriver next update")
 
         monomers = states["monomers"]
+        if self.parameters["compact_monomers"]:
+            monomers = {
+                "box_center": monomers["box_center"],
+                "box_size": monomers["box_size"],
+                **get_monomers_from_arrays(monomers["monomer_arrays"]),
+            }
         monomer_box_size = monomers["box_size"]
         previous_fibers = states["fibers"]
 
         monomer_fibers = MonomerToFiber.generate_fibers_from_monomers(
-            monomers, monomer_box_size
+            monomers,
+            monomer_box_size,
+            self.parameters["fiber_points"],
+            self.parameters["tolerance"],
+            self.parameters["max_points"],
         )
 
         fiber_update = agents_update(previous_fibers, monomer_fibers)
@@ -97,90 +65,59 @@ class MonomerToFiber(Deriver):
         return {"fibers": fiber_update}
 
     @staticmethod
-    def get_next_actin_id(prev_actin_id, neighbor_ids):
+    def get_fiber_ids(chains):
         """
-        Get the ID of the neighbor other than
-        the neighbor with the prev_actin_id
+        Each chain's fiber is keyed by the id of the particle at its pointed end,
+        which doesn't change as ReaDDy's topologies come and go
+        or are renumbered
         """
-        if prev_actin_id < 0:
-            return neighbor_ids[0]
-        for neighbor_id in neighbor_ids:
-            if neighbor_id != prev_actin_id:
-                return neighbor_id
-        return -1
+        return [str(chain["particle_ids"][0]) for chain in chains]
 
     @staticmethod
-    def get_actin_monomer_positions(
-        start_actin_id, particles, prev_actin_id=-1, result=None
+    def generate_fibers_from_monomers(
+        monomers, box_size=500.0, fiber_points="ends", tolerance=1.0, max_points=None
     ):
         """
-        Get monomer positions for an actin chain starting
-        at the pointed end's start_actin_id
+        Transform monomer data into fiber data, with a fiber for each
+        mother and daughter filament, fitting the points of all of them at once
         """
-        if result is None:
-            result = []
-        start_actin = particles[start_actin_id]
-        result.append(start_actin["position"])
-        next_actin_id = MonomerToFiber.get_next_actin_id(
-            prev_actin_id, start_actin["neighbor_ids"]
-        )
-        if next_actin_id < 0:
-            return result
-        return MonomerToFiber.get_actin_monomer_positions(
-            next_actin_id, particles, start_actin_id, result
-        )
-
-    @staticmethod
-    def get_fiber_end_point(end_direction, positions, box_size):
-        """
-        Since we can only calculate axis position
-        given a neighbor in each direction,
-        use the positions of the first and second actin from the end
-        to extrapolate the end axis position
-        """
-        axis_pos1 = ActinUtil.get_actin_axis_position(
-            positions[0:3] if end_direction <= 0 else positions[-3:], box_size
-        )
-        axis_pos2 = ActinUtil.get_actin_axis_position(
-            positions[1:4] if end_direction <= 0 else positions[-4:-1], box_size
-        )
-        return axis_pos1 - 1.5 * (axis_pos2 - axis_pos1)
-
-    @staticmethod
-    def get_fiber(topology_id, pointed_actin_id, monomers, box_size):
-        """
-        Get data for a fiber from a chain of particles
-        """
-        positions = MonomerToFiber.get_actin_monomer_positions(
-            pointed_actin_id, monomers["particles"]
-        )
-        return {
-            "type_name": monomers["topologies"][topology_id]["type_name"],
-            "points": [
-                MonomerToFiber.get_fiber_end_point(-1, positions, box_size),
-                MonomerToFiber.get_fiber_end_point(1, positions, box_size),
-            ],
-        }
-
-    @staticmethod
-    def generate_fibers_from_monomers(monomers, box_size=500.0):
-        """
-        Transform monomer data into fiber data
-        """
-        pointed_actin_ids = {}
-        for topology_id in monomers["topologies"]:
-            # assume first element is the pointed end
-            pointed_actin_ids[topology_id] = monomers["topologies"][topology_id][
-                "particle_ids"
-            ][0]
-        result = {}
-        for topology_id in pointed_actin_ids:
-            result[topology_id] = MonomerToFiber.get_fiber(
-                topology_id,
-                pointed_actin_ids[topology_id],
-                monomers,
-                box_size,
+        chains = get_actin_chains(monomers)
+        fiber_ids = MonomerToFiber.get_fiber_ids(chains)
+        particles = monomers["particles"]
+        fiber_chains = []
+        chain_positions = []
+        for index, chain in enumerate(chains):
+            if len(chain["particle_ids"]) < 4:
+                # too short to fit an axis to both ends
+                continue
+            fiber_chains.append(index)
+            chain_positions.append(
+                np.array(
+                    [
+                        particles[particle_id]["position"]
+                        for particle_id in chain["particle_ids"]
+                    ],
+                    dtype=float,
+                )
+            )
+        if fiber_points == "polyline":
+            points = get_fiber_polylines(
+                chain_positions, box_size, tolerance, max_points
             )
+        else:
+            points = get_fiber_end_points(chain_positions, box_size)
+        result = {}
+        emitted_chains = set(fiber_chains)
+        for fiber_index, index in enumerate(fiber_chains):
+            chain = chains[index]
+            # a daughter of a mother too short to be a fiber has no parent fiber
+            is_daughter = chain["parent"] in emitted_chains
+            result[fiber_ids[index]] = {
+                "type_name": monomers["topologies"][chain["topology_id"]]["type_name"],
+                "points": points[fiber_index],
+                "parent_id": fiber_ids[chain["parent"]] if is_daughter else -1,
+                "branch_point": chain["branch_point"] if is_daughter else np.zeros(3),
+            }
         return result
 
 
@@ -1,22 +1,36 @@
+import logging
+
 import numpy as np
 
 from vivarium.core.process import Process
 from vivarium.core.engine import Engine, pf
 from vivarium.core.control import run_library_cli
 
-from tqdm import tqdm
 from simularium_readdy_models.actin import (
     ActinSimulation,
     ActinUtil,
     ActinTestData,
     ActinAnalyzer,
 )
-from simularium_readdy_models import ReaddyUtil
-from vivarium_models.util import create_monomer_update, format_monomer_results
+from vivarium_models.util import (
+    create_monomer_update,
+    format_monomer_results,
+    get_update_size,
+)
+from vivarium_models.library.monomers import (
+    get_readdy_monomer_arrays,
+    get_monomers_from_arrays,
+    get_monomer_arrays,
+    get_monomer_arrays_update,
+)
+from vivarium_models.library.schema import monomers_schema
 from vivarium_models.library.scan import Scan
+from vivarium_models.library.telemetry import LoopTelemetry
 
 NAME = "ReaDDy_actin"
 
+logger = logging.getLogger(__name__)
+
 test_monomer_data = {
     "monomers": {
         "box_center": np.array([1000.0, 0.0, 0.0]),
@@ -60,73 +74,136 @@ class ReaddyActinProcess(Process):
 
     name = NAME
 
-    defaults = ActinUtil.DEFAULT_PARAMETERS
+    defaults = {
+        **ActinUtil.DEFAULT_PARAMETERS,
+        # keep the ReaDDy kernel alive between steps
+        # and only load topologies added since the last update
+        "incremental": False,
+        # without incremental, build a fresh ReaDDy simulation each update
+        # instead of loading the monomers store into the live kernel,
+        # this is slow since ActinSimulation rebuilds the whole system,
+        # and ReaDDy gives every particle a new id each update
+        "reload_kernel": False,
+        # nm, how far a particle can be moved outside of ReaDDy
+        # before the kernel is fully reloaded,
+        # and how far it must move in ReaDDy to be in the update
+        "position_tolerance": 1e-6,
+        # report ReaDDy steps per second every progress_interval steps,
+        # to progress_callback(summary) if given, otherwise to the log
+        "progress_interval": 0,
+        "progress_callback": None,
+        # evaluate ReaDDy observables every observe_stride internal steps,
+        # or only at the last step of each update if observe_last_only,
+        # the verlet scheme evaluates them every step
+        "observe_stride": 1,
+        "observe_last_only": False,
+        # "default" updates the neighbor list twice every step,
+        # "verlet" builds it with a skin and only updates it
+        # when particles moved more than half the skin,
+        # checked every neighbor_list_check_interval steps,
+        # or after any reaction, counted every step by a ReaDDy observable
+        # since reactions add, remove and move particles,
+        # so it is slower than "default" when reactions happen most steps
+        # (see benchmark_integrator_schemes)
+        "integrator_scheme": "default",
+        "neighbor_list_skin": 2.0,  # nm
+        "neighbor_list_check_interval": 10,
+        # store monomers as one leaf of columnar monomer arrays
+        # instead of a store per particle
+        "compact_monomers": False,
+    }
 
     def __init__(self, parameters=None):
         super(ReaddyActinProcess, self).__init__(parameters)
+        self.telemetry = LoopTelemetry(
+            NAME,
+            self.parameters["progress_interval"],
+            self.parameters["progress_callback"],
+        )
+        self.create_readdy_simulation()
+
+    def create_readdy_simulation(self):
+        """
+        Create a new ReaDDy simulation with an empty kernel
+        """
         actin_simulation = ActinSimulation(self.parameters)
         self.readdy_system = actin_simulation.system
         self.readdy_simulation = actin_simulation.simulation
+        self.kernel_loaded = False
+        self.last_monomers = None
+        self.reactions_occurred = False
+        if self.parameters["integrator_scheme"] == "verlet":
+            self.readdy_simulation.observe.reaction_counts(
+                1, callback=self.count_reactions, save=None
+            )
+
+    def count_reactions(self, reaction_counts):
+        """
+        Remember if any reaction, spatial topology reaction
+        or structural topology reaction happened in the last step
+        """
+        self.reactions_occurred = any(
+            np.any(np.asarray(list(counts.values())) > 0)
+            for counts in reaction_counts
+            if len(counts) > 0
+        )
 
     def ports_schema(self):
         return {
-            "monomers": {
-                "box_center": {
-                    "_default": np.array([1000.0, 0.0, 0.0]),
-                    "_updater": "set",
-                    "_emit": True,
-                },
-                "box_size": {
-                    "_default": 500.0,
-                    "_updater": "set",
-                    "_emit": True,
-                },
-                "topologies": {
-                    "*": {
-                        "type_name": {
-                            "_default": "",
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                        "particle_ids": {
-                            "_default": [],
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                    }
-                },
-                "particles": {
-                    "*": {
-                        "type_name": {
-                            "_default": "",
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                        "position": {
-                            "_default": np.zeros(3),
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                        "neighbor_ids": {
-                            "_default": [],
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                    }
-                },
-            }
+            "monomers": monomers_schema(
+                compact=self.parameters["compact_monomers"], observe_schedule=True
+            )
         }
 
     def initial_state(self, config=None):
         # TODO: make this more general
+        if self.parameters["compact_monomers"]:
+            monomers = test_monomer_data["monomers"]
+            return {
+                "monomers": {
+                    "box_center": monomers["box_center"],
+                    "box_size": monomers["box_size"],
+                    "monomer_arrays": get_monomer_arrays(monomers),
+                }
+            }
         return test_monomer_data
 
+    def get_observe_schedule(self, n_steps):
+        """
+        Get which of the internal ReaDDy steps evaluate observables,
+        every stride steps (starting at 0) and always the last step,
+        a stride of 0 means only the last step.
+        The verlet scheme counts reactions with an observable,
+        so it evaluates observables every step
+        """
+        if self.parameters["integrator_scheme"] == "verlet":
+            stride = 1
+            n_observed = n_steps + 1
+        elif self.parameters["observe_last_only"]:
+            stride = 0
+            n_observed = 1
+        else:
+            stride = max(1, int(self.parameters["observe_stride"]))
+            n_observed = n_steps // stride + 1 + (1 if n_steps % stride else 0)
+        return {
+            "stride": stride,
+            "n_steps": n_steps,
+            "n_observed": n_observed,
+        }
+
     def simulate_readdy(self, timestep):
         """
         Simulate in ReaDDy for the given timestep
+        and return the schedule used to evaluate observables
         """
+        n_steps = int(timestep * 1e9 / self.parameters["internal_timestep"])
+        observe_schedule = self.get_observe_schedule(n_steps)
+        observe_stride = observe_schedule["stride"]
 
         def loop():
+            verlet = self.parameters["integrator_scheme"] == "verlet"
+            skin = self.parameters["neighbor_list_skin"] if verlet else 0.0
+            check_interval = max(1, self.parameters["neighbor_list_check_interval"])
             readdy_actions = self.readdy_simulation._actions
             init = readdy_actions.initialize_kernel()
             diffuse = readdy_actions.integrator_euler_brownian_dynamics(
@@ -134,7 +211,7 @@ class ReaddyActinProcess(Process):
             )
             calculate_forces = readdy_actions.calculate_forces()
             create_nl = readdy_actions.create_neighbor_list(
-                self.readdy_system.calculate_max_cutoff().magnitude
+                self.readdy_system.calculate_max_cutoff().magnitude + skin
             )
             update_nl = readdy_actions.update_neighbor_list()
             react = readdy_actions.reaction_handler_uncontrolled_approximation(
@@ -145,37 +222,238 @@ class ReaddyActinProcess(Process):
             create_nl()
             calculate_forces()
             update_nl()
-            observe(0)
-            n_steps = int(timestep * 1e9 / self.parameters["internal_timestep"])
-            for t in tqdm(range(1, n_steps + 1)):
-                diffuse()
-                update_nl()
-                react()
-                update_nl()
-                calculate_forces()
-                observe(t)
+            if observe_stride > 0 or n_steps == 0:
+                observe(0)
+            if verlet:
+                reference_particles = self.get_particle_positions()
+            self.telemetry.start(n_steps)
+            for first_step, last_step in self.telemetry.get_chunks(n_steps):
+                for t in range(first_step, last_step + 1):
+                    diffuse()
+                    if not verlet:
+                        update_nl()
+                        react()
+                        update_nl()
+                    else:
+                        if t % check_interval == 0:
+                            particles = self.get_particle_positions()
+                            if reference_particles is None or (
+                                ReaddyActinProcess._neighbor_list_expired(
+                                    reference_particles, particles, skin
+                                )
+                            ):
+                                update_nl()
+                                reference_particles = particles
+                        react()
+                        # count this step's reactions without listing particles,
+                        # particles they added, removed or moved must be
+                        # in the neighbor list before forces, and the reference
+                        # positions are read again at the next check
+                        observe(t)
+                        if self.reactions_occurred:
+                            update_nl()
+                            reference_particles = None
+                    calculate_forces()
+                    if not verlet and (
+                        (observe_stride > 0 and t % observe_stride == 0) or t == n_steps
+                    ):
+                        observe(t)
+                self.telemetry.report(last_step)
 
         self.readdy_simulation._run_custom_loop(loop, show_summary=False)
+        return observe_schedule
 
-    def next_update(self, timestep, states):
-        print("in readdy actin process next update")
+    def get_particle_positions(self):
+        """
+        Get the ids and positions of all particles currently in ReaDDy,
+        reading each particle once
+        """
+        values = np.array(
+            [
+                (particle.id, particle.pos[0], particle.pos[1], particle.pos[2])
+                for particle in self.readdy_simulation.current_particles
+            ],
+            dtype=float,
+        ).reshape((-1, 4))
+        return values[:, 0].astype(int), values[:, 1:]
+
+    @staticmethod
+    def _neighbor_list_expired(reference_particles, particles, skin):
+        """
+        Check if a neighbor list built with the given skin
+        when particles were at the reference positions needs to be updated,
+        because particles were added or removed
+        or any particle moved more than half the skin
+        """
+        reference_ids, reference_positions = reference_particles
+        ids, positions = particles
+        if not np.array_equal(reference_ids, ids):
+            return True
+        if len(ids) == 0:
+            return False
+        displacements = np.linalg.norm(positions - reference_positions, axis=1)
+        return np.max(displacements) > 0.5 * skin
+
+    def load_monomers(self, monomers):
+        """
+        Load the monomers store into ReaDDy.
+        In incremental mode the live kernel is kept and only topologies
+        added since the last update are loaded, unless another process
+        changed or removed particles, in which case the kernel is reloaded.
+        Otherwise the store is loaded into the live kernel,
+        or into a fresh one if reload_kernel is True
+        """
+        if self.parameters["incremental"] and self.last_monomers is not None:
+            new_topology_ids = ReaddyActinProcess._get_new_topology_ids(
+                self.last_monomers, monomers, self.parameters["position_tolerance"]
+            )
+            if new_topology_ids is not None:
+                if len(new_topology_ids) > 0:
+                    ActinUtil.add_monomers_from_data(
+                        self.readdy_simulation,
+                        ReaddyActinProcess._get_topologies_subset(
+                            monomers, new_topology_ids
+                        ),
+                    )
+                return
+        if self.kernel_loaded and (
+            self.parameters["incremental"] or self.parameters["reload_kernel"]
+        ):
+            self.create_readdy_simulation()
+        ActinUtil.add_monomers_from_data(self.readdy_simulation, monomers)
+        self.kernel_loaded = True
+
+    @staticmethod
+    def _get_new_topology_ids(previous_monomers, monomers, position_tolerance):
+        """
+        Compare the monomers store to the monomers emitted last update
+        and get the IDs of topologies that were added since then,
+        or None if anything else changed
+        """
+        if not np.allclose(
+            previous_monomers["box_center"], monomers["box_center"]
+        ) or not np.isclose(previous_monomers["box_size"], monomers["box_size"]):
+            return None
+        previous_particles = {
+            str(particle_id): particle
+            for particle_id, particle in previous_monomers["particles"].items()
+        }
+        particles = {
+            str(particle_id): particle
+            for particle_id, particle in monomers["particles"].items()
+        }
+        for particle_id, previous_particle in previous_particles.items():
+            if particle_id not in particles:
+                return None
+            particle = particles[particle_id]
+            if (
+                particle["type_name"] != previous_particle["type_name"]
+                or list(particle["neighbor_ids"])
+                != list(previous_particle["neighbor_ids"])
+                or np.max(
+                    np.abs(
+                        np.array(particle["position"])
+                        - np.array(previous_particle["position"])
+                    )
+                )
+                > position_tolerance
+            ):
+                return None
+        previous_topologies = {
+            str(topology_id): topology
+            for topology_id, topology in previous_monomers["topologies"].items()
+        }
+        new_topology_ids = []
+        new_particle_ids = set()
+        for topology_id, topology in monomers["topologies"].items():
+            previous_topology = previous_topologies.pop(str(topology_id), None)
+            if previous_topology is None:
+                new_topology_ids.append(topology_id)
+                new_particle_ids.update(
+                    str(particle_id) for particle_id in topology["particle_ids"]
+                )
+            elif topology["type_name"] != previous_topology["type_name"] or list(
+                topology["particle_ids"]
+            ) != list(previous_topology["particle_ids"]):
+                return None
+        if len(previous_topologies) > 0:
+            return None
+        # every particle that wasn't emitted last update
+        # must belong to one of the new topologies
+        if set(particles.keys()) - set(previous_particles.keys()) != new_particle_ids:
+            return None
+        return new_topology_ids
 
-        ActinUtil.add_monomers_from_data(self.readdy_simulation, states["monomers"])
-        self.simulate_readdy(timestep)
-        readdy_monomers = ReaddyUtil.get_current_monomers(
+    @staticmethod
+    def _get_topologies_subset(monomers, topology_ids):
+        """
+        Get monomer data for only the given topologies
+        """
+        result = {
+            "box_center": monomers["box_center"],
+            "box_size": monomers["box_size"],
+            "topologies": {},
+            "particles": {},
+        }
+        for topology_id in topology_ids:
+            topology = monomers["topologies"][topology_id]
+            result["topologies"][topology_id] = topology
+            for particle_id in topology["particle_ids"]:
+                result["particles"][particle_id] = monomers["particles"][particle_id]
+        return result
+
+    def next_update(self, timestep, states):
+        logger.debug("in readdy actin process next update")
+
+        monomers = states["monomers"]
+        compact = self.parameters["compact_monomers"]
+        if compact:
+            monomers = {
+                "box_center": monomers["box_center"],
+                "box_size": monomers["box_size"],
+                **get_monomers_from_arrays(monomers["monomer_arrays"]),
+            }
+        self.load_monomers(monomers)
+        observe_schedule = self.simulate_readdy(timestep)
+        monomer_arrays = get_readdy_monomer_arrays(
             self.readdy_simulation.current_topologies
         )
-        transformed_monomers = ReaddyActinProcess._transform_monomers(
-            readdy_monomers, states["monomers"]["box_center"]
-        )
+        ReaddyActinProcess._transform_monomers(monomer_arrays, monomers["box_center"])
+        transformed_monomers = None
+        if self.parameters["incremental"] or not compact:
+            transformed_monomers = get_monomers_from_arrays(monomer_arrays)
+        if self.parameters["incremental"]:
+            self.last_monomers = {
+                "box_center": monomers["box_center"],
+                "box_size": monomers["box_size"],
+                **transformed_monomers,
+            }
 
-        return create_monomer_update(states["monomers"], transformed_monomers)
+        if compact:
+            update = {
+                "monomers": {
+                    "monomer_arrays": get_monomer_arrays_update(
+                        states["monomers"]["monomer_arrays"],
+                        monomer_arrays,
+                        tolerance=self.parameters["position_tolerance"],
+                    )
+                }
+            }
+        else:
+            update = create_monomer_update(
+                monomers,
+                transformed_monomers,
+                tolerance=self.parameters["position_tolerance"],
+            )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"monomers update size {get_update_size(update)}")
+        update["monomers"]["observe_schedule"] = observe_schedule
+        return update
 
     @staticmethod
-    def _transform_monomers(monomers, box_center):
-        for particle_id in monomers["particles"]:
-            monomers["particles"][particle_id]["position"] += box_center
-        return monomers
+    def _transform_monomers(monomer_arrays, box_center):
+        monomer_arrays["positions"] += box_center
+        return monomer_arrays
 
     # functions to configure and run the process
     def run_readdy_actin_process():
@@ -357,7 +635,81 @@ def test_scan_readdy():
     print(results)
 
 
-library = {"0": test_readdy_actin_process, "1": test_scan_readdy}
+def get_free_monomer_data(actin_concentration, box_size):
+    """
+    Get the linear actin test monomers plus free actin monomers
+    at the given concentration (uM) spread randomly through the box (nm)
+    """
+    monomer_data = get_monomer_data()
+    monomers = monomer_data["monomers"]
+    box_size = np.asarray(box_size, dtype=float) * np.ones(3)
+    n_free = int(round(actin_concentration * 1e-30 * 6.022e23 * np.prod(box_size)))
+    first_id = max(monomers["particles"].keys()) + 1
+    first_topology_id = max(monomers["topologies"].keys()) + 1
+    positions = np.random.uniform(-0.5, 0.5, size=(n_free, 3)) * box_size
+    for index in range(n_free):
+        particle_id = first_id + index
+        monomers["topologies"][first_topology_id + index] = {
+            "type_name": "Actin-Monomer",
+            "particle_ids": [particle_id],
+        }
+        monomers["particles"][particle_id] = {
+            "type_name": "actin#free_ATP",
+            "position": positions[index],
+            "neighbor_ids": [],
+        }
+    return monomer_data
+
+
+def benchmark_integrator_schemes():
+    """
+    Compare ReaDDy steps per second for each integrator scheme
+    at several concentrations of free actin monomers
+    """
+    results = {}
+    for actin_concentration in [50.0, 100.0, 200.0, 400.0]:
+        for scheme in ["default", "verlet"]:
+            summaries = []
+            readdy_actin_process = ReaddyActinProcess(
+                {
+                    "actin_concentration": actin_concentration,
+                    "integrator_scheme": scheme,
+                    "progress_interval": 1000,
+                    "progress_callback": summaries.append,
+                }
+            )
+            engine = Engine(
+                **{
+                    "processes": {"readdy_actin_process": readdy_actin_process},
+                    "topology": {
+                        "readdy_actin_process": {
+                            "monomers": ("monomers",),
+                        },
+                    },
+                    "initial_state": get_free_monomer_data(
+                        actin_concentration,
+                        readdy_actin_process.parameters["box_size"],
+                    ),
+                    "emitter": "null",
+                }
+            )
+            engine.update(0.0000001)  # 1e3 steps
+            results[(actin_concentration, scheme)] = summaries[-1]["steps_per_second"]
+    print("actin concentration (uM) | default steps/s | verlet steps/s")
+    for actin_concentration in [50.0, 100.0, 200.0, 400.0]:
+        print(
+            f"{actin_concentration} | "
+            f"{results[(actin_concentration, 'default')]:.1f} | "
+            f"{results[(actin_concentration, 'verlet')]:.1f}"
+        )
+    return results
+
+
+library = {
+    "0": test_readdy_actin_process,
+    "1": test_scan_readdy,
+    "2": benchmark_integrator_schemes,
+}
 
 
 if __name__ == "__main__":
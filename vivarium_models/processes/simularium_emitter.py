@@ -1,23 +1,122 @@
+import hashlib
+import json
+import os
+import uuid
 from typing import Any, Dict
 
 from vivarium.core.emitter import Emitter
 
 import numpy as np
-import pandas as pd
 from simulariumio import (
     TrajectoryConverter,
     TrajectoryData,
-    AgentData,
     MetaData,
     UnitData,
 )
 
+from vivarium_models.library.background import BackgroundWorker
+from vivarium_models.library.fibers import (
+    get_fiber_unique_id,
+    normalize_fiber_points,
+    segments_intersect_box,
+)
+from vivarium_models.library.monomers import (
+    cull_monomers,
+    downsample_monomers,
+    get_monomer_edge_positions,
+    get_monomers_from_arrays,
+)
+from vivarium_models.library.simularium_writer import (
+    SimulariumStreamWriter,
+    get_temp_path,
+)
+from vivarium_models.library.trajectory import TrajectoryBuffer
+
+
+def _get_hashable_parameters(value):
+    """
+    Get parameters as JSON-serializable values that are the same
+    every run: processes become their parameters, arrays become lists
+    and other objects, like callbacks, become their type's name
+    """
+    if hasattr(value, "parameters"):
+        return _get_hashable_parameters(value.parameters)
+    if isinstance(value, dict):
+        return {str(key): _get_hashable_parameters(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_get_hashable_parameters(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return getattr(value, "__qualname__", type(value).__qualname__)
+
+
+def get_parameters_hash(processes):
+    """
+    Hash the parameters of the processes, with sorted keys,
+    so runs with the same parameters get the same hash
+    """
+    parameters = json.dumps(_get_hashable_parameters(processes), sort_keys=True)
+    return hashlib.sha1(parameters.encode()).hexdigest()[:12]
+
 
 class SimulariumEmitter(Emitter):
-    def __init__(self, config: Dict[str, str]) -> None:
+    """
+    Emitter that writes emitted fibers and monomers to a Simularium file.
+    By default frames are kept until get_data converts and writes them all.
+    With "streaming" in the config, frames are converted as they are emitted
+    and written every "flush_interval" frames to a temporary file.
+    Engine doesn't tell the emitter when a run ends, so call
+    engine.emitter.get_data() (or close()) after the last update
+    to finalize the file, until then the final path doesn't exist.
+    With "asynchronous" in the config, frames are
+    streamed the same way on a background thread while the engine keeps
+    stepping, and emit waits when "queue_size" frames are pending.
+    The "output_format" is "json" (default), which the Simularium viewer opens,
+    or "float32" (.simf32), see simularium_writer.
+    The "output_path" can be a template with {run_id} (the experiment id),
+    {parameters_hash} (a hash of the processes' parameters) and {pid} fields,
+    and files are written to a temporary path then renamed,
+    so many emitters can write in parallel.
+    To visualize less than everything, "frame_stride" keeps every Nth frame,
+    "max_frames" keeps at most that many frames (evenly spaced, or the first
+    ones when streaming), "region_center" and "region_size" keep only
+    particles and fibers inside that box, and "monomer_stride" keeps one
+    monomer per K along each filament
+    """
+
+    def __init__(self, config: Dict[str, Any]) -> None:
         super().__init__(config)
         self.configuration_data = None
         self.saved_data: Dict[float, Dict[str, Any]] = {}
+        self.output_path_template = config.get("output_path", "out/actin_test")
+        self.output_path = None
+        self.run_id = config.get("experiment_id") or uuid.uuid4().hex
+        self.scale_factor = 0.1
+        self.box_dimensions = None
+        self.asynchronous = config.get("asynchronous", False)
+        self.streaming = config.get("streaming", False) or self.asynchronous
+        self.flush_interval = config.get("flush_interval", 100)
+        self.output_format = config.get("output_format", "json")
+        self.frame_stride = config.get("frame_stride", 1)
+        self.max_frames = config.get("max_frames", None)
+        self.region_center = config.get("region_center", None)
+        self.region_size = config.get("region_size", None)
+        if (self.region_center is None) != (self.region_size is None):
+            raise ValueError("region_center and region_size must be given together")
+        self.monomer_stride = config.get("monomer_stride", 1)
+        self.n_emitted = 0
+        self.fiber_unique_ids = {}
+        self.prev_choices = None
+        self.trajectory = TrajectoryBuffer()
+        self.writer = None
+        self.closed = False
+        self.worker = None
+        if self.asynchronous:
+            self.worker = BackgroundWorker(config.get("queue_size", 8))
 
     def emit(self, data: Dict[str, Any]) -> None:
         """
@@ -31,170 +130,98 @@ class SimulariumEmitter(Emitter):
         if data["table"] == "history":
             emit_data = data["data"]
             time = emit_data["time"]
-            self.saved_data[time] = {
+            state = {
                 key: value for key, value in emit_data.items() if key not in ["time"]
             }
+            if self.asynchronous:
+                self.worker.submit(self.stream_frame, state)
+            elif self.streaming:
+                self.stream_frame(state)
+            else:
+                self.saved_data[time] = state
 
     def get_simularium_fibers(self, time, fibers, actin_radius, trajectory):
         """
         Shape fiber state data into Simularium fiber agents
         """
-        n_agents = 0
-        time_index = len(trajectory["times"])
-        trajectory["times"].append(time)
-        trajectory["unique_ids"].append([])
-        trajectory["type_names"].append([])
-        trajectory["n_subpoints"].append([])
-        trajectory["subpoints"].append([])
+        unique_ids = []
+        type_names = []
+        fiber_points = []
         for fiber_id in fibers:
             fiber = fibers[fiber_id]
-            n_agents += 1
-            trajectory["unique_ids"][time_index].append(int(fiber_id))
-            trajectory["type_names"][time_index].append(fiber["type_name"])
-            trajectory["n_subpoints"][time_index].append(len(fiber["points"]))
-            trajectory["subpoints"][time_index].append(fiber["points"])
-        trajectory["n_agents"].append(n_agents)
-        trajectory["viz_types"].append(n_agents * [1001.0])
-        trajectory["positions"].append(n_agents * [[0.0, 0.0, 0.0]])
-        trajectory["radii"].append(n_agents * [actin_radius])
+            points = normalize_fiber_points(fiber["points"])
+            if self.region_center is not None and not self.fiber_in_region(points):
+                continue
+            unique_ids.append(get_fiber_unique_id(fiber_id, self.fiber_unique_ids))
+            type_names.append(fiber["type_name"])
+            fiber_points.append(points)
+        n_agents = len(unique_ids)
+        n_subpoints = np.array([len(points) for points in fiber_points], dtype=int)
+        subpoints = np.zeros((n_agents, np.max(n_subpoints, initial=0), 3))
+        for index, points in enumerate(fiber_points):
+            subpoints[index, : len(points)] = points
+        trajectory.add_frame(
+            unique_ids,
+            type_names,
+            1001.0,
+            0.0,
+            actin_radius,
+            n_subpoints,
+            subpoints,
+        )
         return trajectory
 
     def get_simularium_monomers(self, time, monomers, actin_radius, trajectory):
         """
         Shape monomer state data into Simularium agents
         """
-        time_index = len(trajectory["times"])
-        trajectory["times"].append(time)
-        trajectory["unique_ids"].append([])
-        trajectory["type_names"].append([])
-        trajectory["positions"].append([])
-        edge_ids = []
-        edge_positions = []
-        for particle_id in monomers["particles"]:
-            particle = monomers["particles"][particle_id]
-            trajectory["unique_ids"][time_index].append(int(particle_id))
-            trajectory["type_names"][time_index].append(particle["type_name"])
-            trajectory["positions"][time_index].append(np.array(particle["position"]))
-            # visualize edges between particles
-            for neighbor_id in particle["neighbor_ids"]:
-                neighbor_id_str = str(neighbor_id)
-                edge = (particle_id, neighbor_id_str)
-                reverse_edge = (
-                    neighbor_id_str,
-                    particle_id,
-                )
-                if edge not in edge_ids and reverse_edge not in edge_ids:
-                    edge_ids.append(edge)
-                    edge_positions.append(
-                        [
-                            np.array(particle["position"]),
-                            np.array(
-                                monomers["particles"][neighbor_id_str]["position"]
-                            ),
-                        ]
-                    )
-        n_agents = len(trajectory["unique_ids"][time_index])
-        n_edges = len(edge_ids)
-        trajectory["n_agents"].append(n_agents + n_edges)
-        trajectory["viz_types"].append(n_agents * [1000.0])
-        trajectory["viz_types"][time_index] += n_edges * [1001.0]
-        trajectory["unique_ids"][time_index] += [1000 + i for i in range(n_edges)]
-        trajectory["type_names"][time_index] += ["edge" for edge in range(n_edges)]
-        trajectory["positions"][time_index] += n_edges * [[0.0, 0.0, 0.0]]
-        trajectory["radii"].append(n_agents * [actin_radius])
-        trajectory["radii"][time_index] += n_edges * [1.0]
-        trajectory["n_subpoints"].append(n_agents * [0])
-        trajectory["n_subpoints"][time_index] += n_edges * [2]
-        trajectory["subpoints"].append(n_agents * [2 * [[0.0, 0.0, 0.0]]])
-        trajectory["subpoints"][time_index] += edge_positions
-        return trajectory
-
-    @staticmethod
-    def fill_df(df, fill):
-        """
-        Fill Nones in a DataFrame with a fill value
-        """
-        # Create a dataframe of fill values
-        fill_array = [[fill] * df.shape[1]] * df.shape[0]
-        fill_df = pd.DataFrame(fill_array)
-        # Replace all entries with None with the fill
-        df[df.isna()] = fill_df
-        return df
-
-    @staticmethod
-    def jagged_3d_list_to_numpy_array(jagged_3d_list):
-        """
-        Shape a jagged list with 3 dimensions to a numpy array
-        """
-        df = SimulariumEmitter.fill_df(pd.DataFrame(jagged_3d_list), [0.0, 0.0, 0.0])
-        df_t = df.transpose()
-        exploded = [df_t[col].explode() for col in list(df_t.columns)]
-        return np.array(exploded).reshape((df.shape[0], df.shape[1], 3))
-
-    @staticmethod
-    def get_subpoints_numpy_array(trajectory) -> np.ndarray:
-        """
-        Shape a 4 dimensional jagged list for subpoints into a numpy array
-        """
-        frame_arrays = []
-        max_agents = 0
-        max_subpoints = 0
-        total_steps = len(trajectory["subpoints"])
-        for time_index in range(total_steps):
-            frame_array = SimulariumEmitter.jagged_3d_list_to_numpy_array(
-                trajectory["subpoints"][time_index]
-            )
-            if frame_array.shape[0] > max_agents:
-                max_agents = frame_array.shape[0]
-            if frame_array.shape[1] > max_subpoints:
-                max_subpoints = frame_array.shape[1]
-            frame_arrays.append(frame_array)
-        values_per_frame = max_agents * max_subpoints * 3
-        result = np.zeros(total_steps * values_per_frame)
-        for time_index, frame_array in enumerate(frame_arrays):
-            if frame_array.shape[1] < max_subpoints:
-                new_frame_array = np.zeros((frame_array.shape[0], max_subpoints, 3))
-                new_frame_array[:, : frame_array.shape[1]] = frame_array
-                frame_array = new_frame_array
-            flat_array = frame_array.flatten()
-            start_index = time_index * values_per_frame
-            result[start_index : start_index + flat_array.shape[0]] = flat_array
-        return result.reshape(total_steps, max_agents, max_subpoints, 3)
-
-    @staticmethod
-    def get_agent_data_from_jagged_lists(trajectory, scale_factor) -> AgentData:
-        """
-        Shape a dictionary of jagged lists into a Simularium AgentData object
-        """
-        return AgentData(
-            times=np.arange(len(trajectory["times"])),
-            n_agents=np.array(trajectory["n_agents"]),
-            viz_types=SimulariumEmitter.fill_df(
-                pd.DataFrame(trajectory["viz_types"]), 1000.0
-            ).to_numpy(),
-            unique_ids=SimulariumEmitter.fill_df(
-                pd.DataFrame(trajectory["unique_ids"]), 0
-            ).to_numpy(dtype=int),
-            types=trajectory["type_names"],
-            positions=scale_factor
-            * SimulariumEmitter.jagged_3d_list_to_numpy_array(trajectory["positions"]),
-            radii=scale_factor
-            * SimulariumEmitter.fill_df(
-                pd.DataFrame(trajectory["radii"]), 0.0
-            ).to_numpy(),
-            n_subpoints=SimulariumEmitter.fill_df(
-                pd.DataFrame(trajectory["n_subpoints"]), 0
-            ).to_numpy(dtype=int),
-            subpoints=scale_factor
-            * SimulariumEmitter.get_subpoints_numpy_array(trajectory),
+        if "monomer_arrays" in monomers:
+            monomers = {
+                **monomers,
+                **get_monomers_from_arrays(monomers["monomer_arrays"]),
+            }
+        monomers = downsample_monomers(monomers, self.monomer_stride)
+        if self.region_center is not None:
+            monomers = cull_monomers(monomers, self.region_center, self.region_size)
+        particles = monomers["particles"]
+        n_particles = len(particles)
+        unique_ids = []
+        type_names = []
+        positions = np.zeros((n_particles, 3))
+        for index, particle_id in enumerate(particles):
+            particle = particles[particle_id]
+            unique_ids.append(int(particle_id))
+            type_names.append(particle["type_name"])
+            positions[index] = particle["position"]
+        # visualize edges between particles
+        edge_positions = get_monomer_edge_positions(particles)
+        n_edges = len(edge_positions)
+        n_agents = n_particles + n_edges
+        viz_types = np.full(n_agents, 1000.0)
+        viz_types[n_particles:] = 1001.0
+        radii = np.full(n_agents, actin_radius)
+        radii[n_particles:] = 1.0
+        n_subpoints = np.zeros(n_agents, dtype=int)
+        n_subpoints[n_particles:] = 2
+        subpoints = np.zeros((n_agents, 2, 3))
+        subpoints[n_particles:] = edge_positions
+        trajectory.add_frame(
+            unique_ids + [1000 + i for i in range(n_edges)],
+            type_names + n_edges * ["edge"],
+            viz_types,
+            np.vstack([positions, np.zeros((n_edges, 3))]),
+            radii,
+            n_subpoints,
+            subpoints,
         )
+        return trajectory
 
     @staticmethod
     def get_simularium_converter(
         trajectory, box_dimensions, scale_factor
     ) -> TrajectoryConverter:
         """
-        Shape a dictionary of jagged lists into a Simularium TrajectoryData object
+        Shape trajectory buffers into a Simularium TrajectoryData object
         and provide it to a TrajectoryConverter for conversion
         """
         spatial_units = UnitData("nm")
@@ -204,9 +231,7 @@ class SimulariumEmitter(Emitter):
                 meta_data=MetaData(
                     box_size=scale_factor * box_dimensions,
                 ),
-                agent_data=SimulariumEmitter.get_agent_data_from_jagged_lists(
-                    trajectory, scale_factor
-                ),
+                agent_data=trajectory.get_agent_data(scale_factor),
                 time_units=UnitData("count"),
                 spatial_units=spatial_units,
             )
@@ -228,85 +253,182 @@ class SimulariumEmitter(Emitter):
         elif cytosim_active and not medyan_active and not readdy_active:
             return "cytosim"
 
-    def get_data(self) -> dict:
+    def fiber_in_region(self, points):
         """
-        Save the accumulated timeseries history of "emitted" data to file
+        Check if any point or segment of a fiber is inside the region of interest,
+        so fibers that cross the region with both ends outside it are kept
         """
-        if "readdy_actin" in self.configuration_data:
-            actin_radius = self.configuration_data["readdy_actin"]["actin_radius"]
-        else:
-            actin_radius = 3.0  # TODO add to MEDYAN config
-        box_dimensions = None
-        trajectory = {
-            "times": [],
-            "n_agents": [],
-            "viz_types": [],
-            "unique_ids": [],
-            "type_names": [],
-            "positions": [],
-            "radii": [],
-            "n_subpoints": [],
-            "subpoints": [],
-        }
-        times = list(self.saved_data.keys())
-        times.sort()
-        vizualize_time_index = 0
-        for time, state in self.saved_data.items():
-            print(f"time = {time}")
-            index = times.index(time)
-            prev_simulator = "none"
-            if index > 0:
-                prev_simulator = SimulariumEmitter.get_active_simulator(
-                    self.saved_data[times[index - 1]]["choices"]
-                )
-            current_simulator = SimulariumEmitter.get_active_simulator(state["choices"])
-            print(f"prev_simulator = {prev_simulator}")
-            print(f"current_simulator = {current_simulator}")
-            """visualize the first frame in the simulator that started first
-            then subsequent frames according the the simulator that ran 
-            right before that time point"""
-            if prev_simulator == "none":
-                if current_simulator == "medyan" or current_simulator == "cytosim":
-                    print(f"  visualize current {current_simulator}")
-                    if box_dimensions is None:
-                        box_dimensions = np.array(state["fibers_box_extent"])
-                    trajectory = self.get_simularium_fibers(
-                        vizualize_time_index,
-                        state["fibers"],
-                        actin_radius,
-                        trajectory,
-                    )
-                    vizualize_time_index += 1
-                if current_simulator == "readdy":
-                    print("  visualize current readdy")
-                    trajectory = self.get_simularium_monomers(
-                        vizualize_time_index,
-                        state["monomers"],
-                        actin_radius,
-                        trajectory,
+        half_size = 0.5 * np.asarray(self.region_size, dtype=float)
+        min_extent = np.asarray(self.region_center, dtype=float) - half_size
+        max_extent = np.asarray(self.region_center, dtype=float) + half_size
+        if len(points) == 1:
+            return bool(np.all((points >= min_extent) & (points <= max_extent)))
+        return bool(
+            np.any(
+                segments_intersect_box(points[:-1], points[1:], min_extent, max_extent)
+            )
+        )
+
+    def get_frame_indices(self, n_frames):
+        """
+        Choose which of n_frames frames to visualize,
+        every frame_stride-th frame, then at most max_frames evenly spaced
+        """
+        indices = np.arange(0, n_frames, self.frame_stride)
+        if self.max_frames is not None and len(indices) > self.max_frames:
+            indices = indices[
+                np.unique(
+                    np.round(np.linspace(0, len(indices) - 1, self.max_frames)).astype(
+                        int
                     )
-                    vizualize_time_index += 1
-            elif prev_simulator == "medyan" or prev_simulator == "cytosim":
-                print(f"  visualize previous {prev_simulator}")
-                if box_dimensions is None:
-                    box_dimensions = np.array(state["fibers_box_extent"])
+                )
+            ]
+        return set(indices.tolist())
+
+    def get_output_path(self):
+        """
+        Fill in the output path template the first time it is needed
+        """
+        if self.output_path is None:
+            self.output_path = self.output_path_template.format(
+                run_id=self.run_id,
+                parameters_hash=get_parameters_hash(
+                    self.configuration_data["processes"]
+                ),
+                pid=os.getpid(),
+            )
+        return self.output_path
+
+    def get_actin_radius(self):
+        if "readdy_actin" in self.configuration_data:
+            return self.configuration_data["readdy_actin"]["actin_radius"]
+        return 3.0  # TODO add to MEDYAN config
+
+    def add_state_frame(self, state, prev_choices, actin_radius, trajectory):
+        """
+        Visualize the first frame in the simulator that started first
+        then subsequent frames according the the simulator that ran
+        right before that time point, given the previous frame's choices
+        """
+        prev_simulator = "none"
+        if prev_choices is not None:
+            prev_simulator = SimulariumEmitter.get_active_simulator(prev_choices)
+        current_simulator = SimulariumEmitter.get_active_simulator(state["choices"])
+        if prev_simulator == "none":
+            if current_simulator == "medyan" or current_simulator == "cytosim":
+                if self.box_dimensions is None:
+                    self.box_dimensions = np.array(state["fibers_box_extent"])
                 trajectory = self.get_simularium_fibers(
-                    vizualize_time_index,
+                    trajectory.n_frames,
                     state["fibers"],
                     actin_radius,
                     trajectory,
                 )
-                vizualize_time_index += 1
-            elif prev_simulator == "readdy":
-                print("  visualize readdy")
+            if current_simulator == "readdy":
                 trajectory = self.get_simularium_monomers(
-                    vizualize_time_index,
+                    trajectory.n_frames,
                     state["monomers"],
                     actin_radius,
                     trajectory,
                 )
-                vizualize_time_index += 1
-        simularium_converter = SimulariumEmitter.get_simularium_converter(
-            trajectory, box_dimensions, 0.1
+        elif prev_simulator == "medyan" or prev_simulator == "cytosim":
+            if self.box_dimensions is None:
+                self.box_dimensions = np.array(state["fibers_box_extent"])
+            trajectory = self.get_simularium_fibers(
+                trajectory.n_frames,
+                state["fibers"],
+                actin_radius,
+                trajectory,
+            )
+        elif prev_simulator == "readdy":
+            trajectory = self.get_simularium_monomers(
+                trajectory.n_frames,
+                state["monomers"],
+                actin_radius,
+                trajectory,
+            )
+        return trajectory
+
+    def stream_frame(self, state):
+        """
+        Convert a frame as it is emitted
+        and write the converted frames to file every flush_interval frames
+        """
+        n_kept = self.trajectory.n_frames + (
+            0 if self.writer is None else self.writer.n_frames
         )
-        simularium_converter.write_JSON("out/actin_test")
+        if self.n_emitted % self.frame_stride == 0 and (
+            self.max_frames is None or n_kept < self.max_frames
+        ):
+            self.trajectory = self.add_state_frame(
+                state, self.prev_choices, self.get_actin_radius(), self.trajectory
+            )
+        self.prev_choices = state["choices"]
+        self.n_emitted += 1
+        if self.trajectory.n_frames >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the frames converted so far to file
+        """
+        if self.writer is None:
+            self.writer = SimulariumStreamWriter(
+                self.get_output_path(), self.scale_factor, self.output_format
+            )
+        self.writer.write_frames(self.trajectory)
+        self.trajectory = TrajectoryBuffer()
+
+    def close(self):
+        """
+        Write any remaining frames and finalize the file when streaming
+        """
+        if not self.streaming or self.closed:
+            return
+        if self.asynchronous:
+            self.worker.join()
+        self.flush()
+        self.writer.close(self.box_dimensions)
+        self.closed = True
+
+    def get_trajectory(self):
+        """
+        Convert the saved frames to a TrajectoryBuffer
+        in one pass in order of time
+        """
+        actin_radius = self.get_actin_radius()
+        trajectory = TrajectoryBuffer()
+        prev_choices = None
+        times = sorted(self.saved_data.keys())
+        frame_indices = self.get_frame_indices(len(times))
+        for index, time in enumerate(times):
+            state = self.saved_data[time]
+            if index in frame_indices:
+                trajectory = self.add_state_frame(
+                    state, prev_choices, actin_radius, trajectory
+                )
+            prev_choices = state["choices"]
+        return trajectory
+
+    def get_data(self) -> dict:
+        """
+        Save the accumulated timeseries history of "emitted" data to file
+        """
+        if self.streaming:
+            self.close()
+            return
+        trajectory = self.get_trajectory()
+        if self.output_format == "json":
+            simularium_converter = SimulariumEmitter.get_simularium_converter(
+                trajectory, self.box_dimensions, self.scale_factor
+            )
+            output_path = self.get_output_path()
+            temp_path = get_temp_path(output_path)
+            simularium_converter.write_JSON(temp_path)
+            os.replace(temp_path + ".simularium", output_path + ".simularium")
+        else:
+            writer = SimulariumStreamWriter(
+                self.get_output_path(), self.scale_factor, self.output_format
+            )
+            writer.write_frames(trajectory)
+            writer.close(self.box_dimensions)
@@ -3,37 +3,30 @@ import numpy as np
 from vivarium.core.process import Deriver
 from vivarium.core.engine import Engine, pf
 from simularium_readdy_models.actin import ActinTestData
-from simulariumio import (
-    TrajectoryConverter,
-    TrajectoryData,
-    AgentData,
-    MetaData,
-    UnitData,
+
+from ..library.fibers import (
+    get_fiber_unique_id,
+    normalize_fiber_points,
+    normalize_fibers,
 )
+from ..library.schema import fibers_schema
+from ..library.simularium_writer import get_simularium_output
+from ..library.trajectory import TrajectoryBuffer
 
 
 class VisualizeFilament(Deriver):
-    defaults = {}
+    defaults = {
+        # "json" for the Simularium viewer, or "float32", see simularium_writer
+        "output_format": "json",
+    }
 
     def __init__(self, parameters=None):
         super().__init__(parameters)
+        self.unique_ids = {}
 
     def ports_schema(self):
         return {
-            "filaments": {
-                "*": {
-                    "type_name": {
-                        "_default": "",
-                        "_updater": "set",
-                        "_emit": True,
-                    },
-                    "points": {
-                        "_default": [],
-                        "_updater": "set",
-                        "_emit": True,
-                    },
-                }
-            },
+            "filaments": fibers_schema(box_extent=False)["fibers"],
             "simularium_json": {
                 "_default": "",
                 "_updater": "set",
@@ -46,45 +39,43 @@ class VisualizeFilament(Deriver):
 
         box_size = 150.0
         actin_radius = 3.0
-        n_agents = 0
         unique_ids = []
         type_names = []
-        n_subpoints = []
-        subpoints = []
+        filament_points = []
         for filament_id in filaments:
             filament = filaments[filament_id]
             unique_ids.append(filament_id)
             type_names.append(filament["type_name"])
-            n_subpoints.append(len(filament["points"]))
-            subpoints.append(filament["points"])
-            n_agents += 1
-        subpoints = np.array([subpoints], dtype=float)
+            filament_points.append(normalize_fiber_points(filament["points"]))
+        n_subpoints = np.array([len(points) for points in filament_points], dtype=int)
+        subpoints = np.zeros((len(unique_ids), np.max(n_subpoints, initial=0), 3))
+        for index, points in enumerate(filament_points):
+            subpoints[index, : len(points)] = points
 
         # HACK around a Simularium Viewer bug
-        subpoints[0][0][1][2] += 0.001
-
-        simularium_json = TrajectoryConverter(
-            TrajectoryData(
-                meta_data=MetaData(
-                    box_size=np.array([box_size, box_size, box_size]),
-                ),
-                agent_data=AgentData(
-                    times=np.array([0]),
-                    n_agents=np.array([n_agents]),
-                    viz_types=1001.0 * np.ones((1, n_agents)),
-                    unique_ids=np.array([unique_ids]),
-                    types=[type_names],
-                    positions=np.zeros((1, n_agents, 3)),
-                    radii=actin_radius * np.ones((1, n_agents)),
-                    n_subpoints=np.array([n_subpoints]),
-                    subpoints=subpoints,
-                ),
-                time_units=UnitData("ns"),  # nanoseconds
-                spatial_units=UnitData("nm"),  # nanometers
+        if subpoints.shape[1] > 1:
+            subpoints[0][1][2] += 0.001
+
+        trajectory = TrajectoryBuffer()
+        trajectory.add_frame(
+            [
+                get_fiber_unique_id(filament_id, self.unique_ids)
+                for filament_id in unique_ids
+            ],
+            type_names,
+            1001.0,
+            0.0,
+            actin_radius,
+            n_subpoints,
+            subpoints,
+        )
+
+        box_dimensions = np.array([box_size, box_size, box_size])
+        return {
+            "simularium_json": get_simularium_output(
+                trajectory, box_dimensions, self.parameters["output_format"]
             )
-        ).to_JSON()
-
-        return {"simularium_json": simularium_json}
+        }
 
 
 def get_initial_filament_data():
@@ -92,7 +83,7 @@ def get_initial_filament_data():
     filaments_dict = {}
     for fiber in fibers:
         filaments_dict[fiber.fiber_id] = dict(fiber)
-    return filaments_dict
+    return normalize_fibers(filaments_dict)
 
 
 def test_visualize_filament():
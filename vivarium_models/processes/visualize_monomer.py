@@ -4,58 +4,32 @@ from vivarium.core.process import Deriver
 from vivarium.core.engine import Engine, pf
 
 from simularium_readdy_models.actin import ActinTestData
-from simulariumio import (
-    TrajectoryConverter,
-    TrajectoryData,
-    AgentData,
-    MetaData,
-    UnitData,
+
+from ..library.monomers import (
+    get_edge_indices_from_arrays,
+    get_monomer_edge_positions,
 )
+from ..library.schema import monomers_schema
+from ..library.simularium_writer import get_simularium_output
+from ..library.trajectory import TrajectoryBuffer
 
 
 class VisualizeMonomer(Deriver):
-    defaults = {}
+    defaults = {
+        # "json" for the Simularium viewer, or "float32", see simularium_writer
+        "output_format": "json",
+        # read monomers stored as one leaf of columnar monomer arrays
+        "compact_monomers": False,
+    }
 
     def __init__(self, parameters=None):
         super().__init__(parameters)
 
     def ports_schema(self):
         return {
-            "monomers": {
-                "topologies": {
-                    "*": {
-                        "type_name": {
-                            "_default": "",
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                        "particle_ids": {
-                            "_default": [],
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                    }
-                },
-                "particles": {
-                    "*": {
-                        "type_name": {
-                            "_default": "",
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                        "position": {
-                            "_default": np.zeros(3),
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                        "neighbor_ids": {
-                            "_default": [],
-                            "_updater": "set",
-                            "_emit": True,
-                        },
-                    }
-                },
-            },
+            "monomers": monomers_schema(
+                compact=self.parameters["compact_monomers"], box=False
+            ),
             "simularium_json": {
                 "_default": "",
                 "_updater": "set",
@@ -68,67 +42,56 @@ class VisualizeMonomer(Deriver):
 
         box_size = 150.0
         actin_radius = 3.0
-        unique_ids = []
-        type_names = []
-        positions = []
-        edge_ids = []
-        edge_positions = []
-        for particle_id in monomers["particles"]:
-            particle = monomers["particles"][particle_id]
-            unique_ids.append(particle_id)
-            type_names.append(particle["type_name"])
-            positions.append(particle["position"])
-            for neighbor_id in particle["neighbor_ids"]:
-                edge = (particle_id, neighbor_id)
-                reverse_edge = (
-                    neighbor_id,
-                    particle_id,
-                )
-                if edge not in edge_ids and reverse_edge not in edge_ids:
-                    edge_ids.append(edge)
-                    edge_positions.append(
-                        [
-                            particle["position"],
-                            monomers["particles"][neighbor_id]["position"],
-                        ]
-                    )
+        if self.parameters["compact_monomers"]:
+            monomer_arrays = monomers["monomer_arrays"]
+            unique_ids = monomer_arrays["ids"].tolist()
+            type_names = [
+                monomer_arrays["type_names"][type_code]
+                for type_code in monomer_arrays["type_codes"]
+            ]
+            positions = list(monomer_arrays["positions"])
+            edge_positions = monomer_arrays["positions"][
+                get_edge_indices_from_arrays(monomer_arrays)
+            ].reshape((-1, 2, 3))
+        else:
+            unique_ids = []
+            type_names = []
+            positions = []
+            for particle_id in monomers["particles"]:
+                particle = monomers["particles"][particle_id]
+                unique_ids.append(particle_id)
+                type_names.append(particle["type_name"])
+                positions.append(particle["position"])
+            edge_positions = get_monomer_edge_positions(monomers["particles"])
         # add fiber agents for edges
         n_agents = len(unique_ids)
-        n_edges = len(edge_ids)
-        viz_types = 1000.0 * np.ones((1, n_agents + n_edges))
-        viz_types[:, n_agents:] += 1
-        unique_ids = np.array([unique_ids + [1000 + i for i, e in enumerate(edge_ids)]])
-        type_names += ["edge" for edge in edge_ids]
+        n_edges = len(edge_positions)
+        viz_types = 1000.0 * np.ones(n_agents + n_edges)
+        viz_types[n_agents:] += 1
         positions += n_edges * [np.zeros(3)]
-        radii = actin_radius * np.ones((1, n_agents + n_edges))
-        radii[:, n_agents:] = 1.0
-        n_subpoints = np.zeros(n_agents + n_edges)
+        radii = actin_radius * np.ones(n_agents + n_edges)
+        radii[n_agents:] = 1.0
+        n_subpoints = np.zeros(n_agents + n_edges, dtype=int)
         n_subpoints[n_agents:] += 2
         subpoints = np.zeros((n_agents + n_edges, 2, 3))
-        subpoints[n_agents:] = np.array(edge_positions)
-
-        simularium_json = TrajectoryConverter(
-            TrajectoryData(
-                meta_data=MetaData(
-                    box_size=np.array([box_size, box_size, box_size]),
-                ),
-                agent_data=AgentData(
-                    times=np.array([0]),
-                    n_agents=np.array([n_agents + n_edges]),
-                    viz_types=viz_types,
-                    unique_ids=unique_ids,
-                    types=[type_names],
-                    positions=np.array([positions]),
-                    radii=radii,
-                    n_subpoints=np.array([n_subpoints]),
-                    subpoints=np.array([subpoints]),
-                ),
-                time_units=UnitData("ns"),  # nanoseconds
-                spatial_units=UnitData("nm"),  # nanometers
+        subpoints[n_agents:] = edge_positions
+        trajectory = TrajectoryBuffer()
+        trajectory.add_frame(
+            unique_ids + [1000 + i for i in range(n_edges)],
+            type_names + n_edges * ["edge"],
+            viz_types,
+            np.array(positions).reshape((-1, 3)),
+            radii,
+            n_subpoints,
+            subpoints,
+        )
+
+        box_dimensions = np.array([box_size, box_size, box_size])
+        return {
+            "simularium_json": get_simularium_output(
+                trajectory, box_dimensions, self.parameters["output_format"]
             )
-        ).to_JSON()
-
-        return {"simularium_json": simularium_json}
+        }
 
 
 def test_visualize_monomer():
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for running calls on a background thread
+"""
+
+import threading
+
+import pytest
+
+from vivarium_models.library.background import BackgroundWorker
+
+
+def test_background_worker_order_and_back_pressure():
+    """
+    Test that calls run in order and submit waits when the queue is full
+    """
+    release = threading.Event()
+    calls = []
+
+    def record(value):
+        release.wait()
+        calls.append(value)
+        return value
+
+    worker = BackgroundWorker(queue_size=2)
+    worker.submit(record, 0)
+    worker.submit(record, 1)
+    blocked = threading.Thread(target=worker.submit, args=(record, 2))
+    blocked.start()
+    blocked.join(0.05)
+    assert blocked.is_alive()
+    release.set()
+    blocked.join()
+    assert worker.join() == 2
+    assert calls == [0, 1, 2]
+
+
+def test_background_worker_error():
+    """
+    Test that an error in a call is raised in the caller
+    """
+
+    def fail():
+        raise ValueError("failed")
+
+    worker = BackgroundWorker()
+    worker.submit(fail)
+    with pytest.raises(ValueError):
+        worker.join()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for generating monomers from fibers
+"""
+
+import numpy as np
+import pytest
+
+from vivarium_models.processes.fiber_to_monomer import FiberToMonomer
+from vivarium_models.util import get_update_size
+
+BOX_CENTER = np.zeros(3)
+BOX_SIZE = 500.0
+
+
+def get_fibers(start_x, end_x):
+    return {
+        "1": {
+            "type_name": "Actin-Polymer",
+            "points": np.array([[start_x, 0.0, 0.0], [end_x, 0.0, 0.0]]),
+        }
+    }
+
+
+def get_generated_monomers(fiber_to_monomer):
+    """
+    Get the monomers store as it is after the last update,
+    from the monomers generated for each fiber
+    """
+    monomers = {
+        "box_center": BOX_CENTER,
+        "box_size": BOX_SIZE,
+        "topologies": {},
+        "particles": {},
+    }
+    for segment in fiber_to_monomer.segments.values():
+        monomers["topologies"].update(segment["topologies"])
+        monomers["particles"].update(segment["particles"])
+    return monomers
+
+
+def hand_off(fiber_to_monomer, fibers):
+    """
+    Update from the fibers, starting from the monomers of the last update
+    """
+    monomers = get_generated_monomers(fiber_to_monomer)
+    update = fiber_to_monomer.next_update(0, {"fibers": fibers, "monomers": monomers})
+    return update, get_generated_monomers(fiber_to_monomer)
+
+
+def test_repeat_hand_off_is_empty():
+    """
+    Test that handing off the same fibers again,
+    or fibers that moved less than the tolerance, changes nothing
+    """
+    fiber_to_monomer = FiberToMonomer()
+    update, _ = hand_off(fiber_to_monomer, get_fibers(-100.0, 100.0))
+    assert get_update_size(update)["added"] > 0
+    update, _ = hand_off(fiber_to_monomer, get_fibers(-100.0, 100.0))
+    assert get_update_size(update) == {
+        "added": 0,
+        "deleted": 0,
+        "changed": 0,
+        "values": 0,
+    }
+    update, _ = hand_off(fiber_to_monomer, get_fibers(-100.0, 100.2))
+    assert get_update_size(update)["values"] == 0
+
+
+def test_shrunk_fiber_reuses_ids():
+    """
+    Test that a fiber that gets shorter keeps its particle id range
+    and topology ids
+    """
+    fiber_to_monomer = FiberToMonomer()
+    _, monomers = hand_off(fiber_to_monomer, get_fibers(-100.0, 100.0))
+    segment = fiber_to_monomer.segments["1"]
+    _, shrunk_monomers = hand_off(fiber_to_monomer, get_fibers(-100.0, 50.0))
+    shrunk_segment = fiber_to_monomer.segments["1"]
+    assert shrunk_segment["particle_base"] == segment["particle_base"]
+    assert shrunk_segment["particle_capacity"] == segment["particle_capacity"]
+    assert shrunk_segment["topology_ids"] == segment["topology_ids"]
+    assert set(shrunk_monomers["particles"]) < set(monomers["particles"])
+
+
+def test_grown_fiber_gets_new_ids():
+    """
+    Test that a fiber that gets longer gets a new particle id range
+    with no neighbor ids pointing at particles that don't exist
+    """
+    fiber_to_monomer = FiberToMonomer()
+    _, monomers = hand_off(fiber_to_monomer, get_fibers(-100.0, 50.0))
+    _, grown_monomers = hand_off(fiber_to_monomer, get_fibers(-100.0, 150.0))
+    assert len(grown_monomers["particles"]) > len(monomers["particles"])
+    assert set(grown_monomers["particles"]).isdisjoint(monomers["particles"])
+    for particle in grown_monomers["particles"].values():
+        assert set(particle["neighbor_ids"]) <= set(grown_monomers["particles"])
+    for topology in grown_monomers["topologies"].values():
+        assert set(topology["particle_ids"]) <= set(grown_monomers["particles"])
+
+
+def test_tolerance():
+    """
+    Test that a tolerance of 0 keys fibers by their exact points
+    and a negative tolerance is rejected
+    """
+    fiber_to_monomer = FiberToMonomer({"tolerance": 0.0})
+    points = get_fibers(-100.0, 100.0)["1"]["points"]
+    key = fiber_to_monomer.get_segment_key(points, BOX_CENTER, BOX_SIZE)
+    assert key == fiber_to_monomer.get_segment_key(points, BOX_CENTER, BOX_SIZE)
+    assert key != fiber_to_monomer.get_segment_key(points + 0.01, BOX_CENTER, BOX_SIZE)
+    with pytest.raises(ValueError):
+        FiberToMonomer({"tolerance": -1.0})
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for converting actin chains to fibers
+"""
+
+import numpy as np
+from simularium_readdy_models.actin import ActinUtil
+
+from vivarium_models.data.fibers import centered_initial_fibers, initial_fibers
+from vivarium_models.library.fibers import (
+    FiberIndex,
+    get_actin_axis_positions,
+    get_actin_chains,
+    get_chain_particle_ids,
+    get_fiber_end_points,
+    get_actin_helix,
+    get_fiber_polylines,
+    get_fiber_unique_id,
+    normalize_fiber_points,
+    segments_intersect_box,
+    simplify_polyline,
+)
+from vivarium_models.processes.monomer_to_fiber import MonomerToFiber
+
+
+def test_actin_axis_positions():
+    """
+    Test that batched axis positions match ActinUtil, across the boundary too
+    """
+    rng = np.random.default_rng(0)
+    box_size = np.full(3, 100.0)
+    triples = rng.uniform(-49.0, 49.0, (20, 3, 3))
+    triples[0] = [[-49.0, 0.5, 0.2], [49.5, 0.0, 0.0], [46.8, 1.0, -0.5]]
+    expected = [
+        ActinUtil.get_actin_axis_position(list(np.copy(triple)), box_size)
+        for triple in triples
+    ]
+    assert np.allclose(get_actin_axis_positions(triples, box_size), expected)
+
+
+def test_long_chain():
+    """
+    Test that a chain longer than the recursion limit is walked in order
+    and its end points are fit
+    """
+    n_particles = 5000
+    angles = np.arange(n_particles) * np.deg2rad(166.6)
+    positions = np.column_stack(
+        [2.75 * np.arange(n_particles), 3 * np.cos(angles), 3 * np.sin(angles)]
+    )
+    particles = {
+        particle_id: {
+            "position": positions[particle_id],
+            "neighbor_ids": [
+                neighbor_id
+                for neighbor_id in [particle_id + 1, particle_id - 1]
+                if 0 <= neighbor_id < n_particles
+            ],
+        }
+        for particle_id in range(n_particles)
+    }
+    assert get_chain_particle_ids(0, particles) == list(range(n_particles))
+    end_points = get_fiber_end_points([positions], 1e6)
+    assert end_points.shape == (1, 2, 3)
+    assert end_points[0, 0, 0] < 0.0
+    assert end_points[0, 1, 0] > positions[-2, 0]
+
+
+def test_simplify_polyline():
+    """
+    Test that points are added where the polyline deviates most
+    """
+    points = np.array(
+        [
+            [0.0, 0.0, 0.0],
+            [1.0, 0.1, 0.0],
+            [2.0, 3.0, 0.0],
+            [3.0, 0.2, 0.0],
+            [4.0, 0, 0],
+        ]
+    )
+    assert np.allclose(simplify_polyline(points, 1.0), points[[0, 2, 4]])
+    assert np.allclose(simplify_polyline(points, 0.0, max_points=2), points[[0, 4]])
+    assert len(simplify_polyline(points, 0.0)) == 5
+
+
+def test_fiber_polylines():
+    """
+    Test that a bent chain's polyline follows its bend
+    and shares its end points with the two point fiber
+    """
+    n_particles = 200
+    arc = np.deg2rad(90.0) * np.arange(n_particles) / n_particles
+    radius = 2.8 * n_particles / np.deg2rad(90.0)
+    positions = get_actin_helix(
+        np.column_stack(
+            [radius * np.sin(arc), radius * (1 - np.cos(arc)), np.zeros(n_particles)]
+        )
+    )
+    box_size = 1e6
+    polyline = get_fiber_polylines([positions], box_size, tolerance=1.0)[0]
+    end_points = get_fiber_end_points([positions], box_size)[0]
+    assert 4 < len(polyline) < n_particles / 5
+    assert np.allclose(polyline[[0, -1]], end_points)
+    limited = get_fiber_polylines([positions], box_size, 0.0, max_points=4)[0]
+    assert len(limited) == 4
+
+
+def get_branched_monomers(n_mother=8, branch_index=3):
+    """
+    A mother filament of n_mother actins 0 to n_mother - 1 listed barbed end
+    first, with a daughter of actins 10-14 bound by arps 8-9
+    to mother actins branch_index and branch_index + 1
+    """
+    mother_types = [f"actin#{n % 3 + 1}" for n in range(n_mother)]
+    mother_types[0] = "actin#pointed_1"
+    daughter_types = ["actin#branch_1"] + [f"actin#{n % 3 + 1}" for n in range(1, 5)]
+    particles = {}
+    for index, type_name in enumerate(mother_types):
+        particles[index] = {
+            "type_name": type_name,
+            "position": np.array([float(index), 0.0, 0.0]),
+            "neighbor_ids": [i for i in [index - 1, index + 1] if 0 <= i < n_mother],
+        }
+    for index, type_name in enumerate(daughter_types):
+        particles[10 + index] = {
+            "type_name": type_name,
+            "position": np.array([float(branch_index), 1.0 + index, 0.0]),
+            "neighbor_ids": [i for i in [9 + index, 11 + index] if 10 <= i < 15],
+        }
+    particles[8] = {
+        "type_name": "arp2#branched",
+        "position": np.array([float(branch_index), 0.5, 0.0]),
+        "neighbor_ids": [branch_index, 9, 10],
+    }
+    particles[9] = {
+        "type_name": "arp3",
+        "position": np.array([branch_index + 1.0, 0.5, 0.0]),
+        "neighbor_ids": [branch_index + 1, 8],
+    }
+    particles[branch_index]["neighbor_ids"].append(8)
+    particles[branch_index + 1]["neighbor_ids"].append(9)
+    particles[10]["neighbor_ids"].append(8)
+    return {
+        "topologies": {
+            0: {
+                "type_name": "Actin-Polymer",
+                "particle_ids": list(reversed(sorted(particles))),
+            }
+        },
+        "particles": particles,
+    }
+
+
+def test_branched_actin_chains():
+    """
+    Test that a branched network is split into a mother and a daughter chain,
+    each ordered from its pointed end, at the arp2/3 that binds the daughter
+    """
+    monomers = get_branched_monomers()
+    chains = get_actin_chains(monomers)
+    assert [chain["particle_ids"] for chain in chains] == [
+        list(range(10, 15)),
+        list(range(8)),
+    ]
+    assert chains[0]["parent"] == 1
+    assert np.allclose(chains[0]["branch_point"], [3.0, 0.5, 0.0])
+    assert chains[1]["parent"] is None
+
+
+def test_segments_intersect_box():
+    """
+    Test segments inside, crossing, missing and parallel to a box
+    """
+    starts = np.array(
+        [[0.5, 0.5, 0.5], [-1.0, 0.5, 0.5], [-1.0, 2.0, 0.5], [-1.0, 1.0, 0.5]]
+    )
+    ends = np.array([[0.6, 0.6, 0.6], [2.0, 0.5, 0.5], [2.0, 2.0, 0.5], [-0.5, 2, 0.5]])
+    assert segments_intersect_box(starts, ends, np.zeros(3), np.ones(3)).tolist() == [
+        True,
+        True,
+        False,
+        False,
+    ]
+
+
+def test_fiber_index():
+    """
+    Test that the fibers found in a box are the ones with a segment in it
+    """
+    rng = np.random.default_rng(0)
+    fibers = {
+        fiber_id: {"points": rng.uniform(0.0, 1000.0, (rng.integers(1, 6), 3))}
+        for fiber_id in range(200)
+    }
+    fiber_index = FiberIndex(fibers)
+    min_extent = np.array([200.0, 300.0, 400.0])
+    max_extent = np.array([500.0, 600.0, 700.0])
+    expected = [
+        fiber_id
+        for fiber_id, fiber in fibers.items()
+        if len(fiber["points"]) > 1
+        and np.any(
+            segments_intersect_box(
+                fiber["points"][:-1], fiber["points"][1:], min_extent, max_extent
+            )
+        )
+    ]
+    assert 0 < len(expected) < 200
+    assert fiber_index.query_box(min_extent, max_extent) == expected
+    assert fiber_index.query_box(np.full(3, 2000.0), np.full(3, 3000.0)) == []
+
+
+def test_normalize_fiber_points():
+    """
+    Test that lists of points become one array
+    and arrays already in that form are not copied
+    """
+    points = normalize_fiber_points([np.zeros(3), np.ones(3)])
+    assert points.shape == (2, 3)
+    assert points.flags["C_CONTIGUOUS"]
+    assert normalize_fiber_points(points) is points
+    assert normalize_fiber_points([]).shape == (0, 3)
+
+
+def test_centered_initial_fibers():
+    """
+    Test that centering the initial fibers doesn't change the module's fibers
+    """
+    first_point = np.copy(initial_fibers["fibers"]["1"]["points"][0])
+    fibers = centered_initial_fibers()
+    centered_initial_fibers()
+    assert np.array_equal(initial_fibers["fibers"]["1"]["points"][0], first_point)
+    assert fibers["fibers"]["1"]["points"].shape == (2, 3)
+    assert np.allclose(fibers["fibers"]["1"]["points"][0], [-1000.0, -87.5, 0.0])
+
+
+def test_fiber_ids_are_stable():
+    """
+    Test that fibers are keyed by their pointed end particle,
+    so their ids don't change when topologies are renumbered or added,
+    and that a daughter of a mother too short to be a fiber has no parent
+    """
+    monomers = get_branched_monomers()
+    fibers = MonomerToFiber.generate_fibers_from_monomers(monomers)
+    assert sorted(fibers.keys()) == ["0", "10"]
+    assert fibers["10"]["parent_id"] == "0"
+    assert fibers["0"]["parent_id"] == -1
+    monomers["topologies"] = {
+        "new": {"type_name": "Actin-Monomer", "particle_ids": [20]},
+        7: monomers["topologies"][0],
+    }
+    monomers["particles"][20] = {
+        "type_name": "actin#free",
+        "position": np.zeros(3),
+        "neighbor_ids": [],
+    }
+    assert sorted(MonomerToFiber.generate_fibers_from_monomers(monomers)) == [
+        "0",
+        "10",
+    ]
+    short_mother = get_branched_monomers(n_mother=3, branch_index=1)
+    fibers = MonomerToFiber.generate_fibers_from_monomers(short_mother)
+    assert list(fibers.keys()) == ["10"]
+    assert fibers["10"]["parent_id"] == -1
+
+
+def test_fiber_unique_ids():
+    """
+    Test that fibers keep their Simularium agent id between frames
+    """
+    unique_ids = {}
+    assert get_fiber_unique_id("3_9", unique_ids) == 0
+    assert get_fiber_unique_id(3, unique_ids) == 1
+    assert get_fiber_unique_id("3_9", unique_ids) == 0
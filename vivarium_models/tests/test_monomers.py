@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for columnar monomer data
+"""
+
+import numpy as np
+import pytest
+
+from vivarium_models.library.monomers import (
+    cull_monomers,
+    downsample_monomers,
+    get_monomer_edge_positions,
+    get_edge_indices_from_arrays,
+    get_monomer_arrays,
+    get_particle_indices,
+    get_monomers_from_arrays,
+    get_monomer_arrays_update,
+    update_monomer_arrays,
+)
+
+
+def get_branched_particles():
+    return {
+        0: {"type_name": "actin", "position": np.zeros(3), "neighbor_ids": [1]},
+        1: {"type_name": "actin", "position": np.ones(3), "neighbor_ids": [0, 2, 3]},
+        2: {"type_name": "actin", "position": 2 * np.ones(3), "neighbor_ids": [1]},
+        3: {"type_name": "arp2", "position": 3 * np.ones(3), "neighbor_ids": [1]},
+    }
+
+
+def test_monomer_edge_positions():
+    """
+    Test that each bond is visualized once, in order of first appearance
+    """
+    edge_positions = get_monomer_edge_positions(get_branched_particles())
+    assert edge_positions.shape == (3, 2, 3)
+    assert np.allclose(edge_positions[:, 0, 0], [0.0, 1.0, 1.0])
+    assert np.allclose(edge_positions[:, 1, 0], [1.0, 2.0, 3.0])
+    assert get_monomer_edge_positions({}).shape == (0, 2, 3)
+
+
+def test_edge_indices_from_arrays():
+    """
+    Test that each bond is found once from CSR neighbor arrays
+    """
+    monomer_arrays = {
+        "ids": np.array([10, 13, 11, 12]),
+        "neighbor_offsets": np.array([0, 1, 2, 5, 6]),
+        "neighbor_ids": np.array([11, 11, 10, 12, 13, 11]),
+    }
+    edges = get_edge_indices_from_arrays(monomer_arrays)
+    assert edges.tolist() == [[0, 2], [1, 2], [2, 3]]
+
+
+def get_chain_monomers(n_particles):
+    particles = {
+        index: {
+            "type_name": "actin",
+            "position": np.array([float(index), 0.0, 0.0]),
+            "neighbor_ids": [
+                neighbor
+                for neighbor in [index - 1, index + 1]
+                if 0 <= neighbor < n_particles
+            ],
+        }
+        for index in range(n_particles)
+    }
+    return {
+        "topologies": {
+            0: {"type_name": "Actin-Polymer", "particle_ids": list(range(n_particles))}
+        },
+        "particles": particles,
+    }
+
+
+def test_downsample_monomers():
+    """
+    Test that one monomer per stride and the ends are kept and reconnected
+    """
+    downsampled = downsample_monomers(get_chain_monomers(8), 3)
+    assert list(downsampled["particles"].keys()) == [0, 3, 6, 7]
+    assert downsampled["particles"][3]["neighbor_ids"] == [0, 6]
+    assert downsampled["particles"][7]["neighbor_ids"] == [6]
+    assert downsampled["topologies"][0]["particle_ids"] == [0, 3, 6, 7]
+    branched = downsample_monomers(
+        {"topologies": {}, "particles": get_branched_particles()}, 5
+    )
+    assert sorted(branched["particles"].keys()) == [0, 1, 2, 3]
+
+
+def test_cull_monomers():
+    """
+    Test that only particles in the region and bonds between them are kept
+    """
+    culled = cull_monomers(get_chain_monomers(8), [2.0, 0.0, 0.0], [3.0, 1.0, 1.0])
+    assert list(culled["particles"].keys()) == [1, 2, 3]
+    assert culled["particles"][1]["neighbor_ids"] == [2]
+    assert culled["topologies"][0]["particle_ids"] == [1, 2, 3]
+
+
+def test_monomer_arrays_round_trip():
+    """
+    Test that monomers converted to columnar arrays convert back the same
+    """
+    monomers = {"topologies": {}, "particles": get_branched_particles()}
+    monomer_arrays = get_monomer_arrays(monomers)
+    assert monomer_arrays["type_names"] == ["actin", "arp2"]
+    assert monomer_arrays["neighbor_offsets"].tolist() == [0, 1, 4, 5, 6]
+    particles = get_monomers_from_arrays(monomer_arrays)["particles"]
+    assert particles.keys() == monomers["particles"].keys()
+    for particle_id, particle in particles.items():
+        expected = monomers["particles"][particle_id]
+        assert particle["type_name"] == expected["type_name"]
+        assert np.allclose(particle["position"], expected["position"])
+        assert particle["neighbor_ids"] == expected["neighbor_ids"]
+
+
+def test_monomer_arrays_update():
+    """
+    Test that applying an update between monomer arrays
+    to the previous arrays gives the new ones
+    """
+    previous_particles = get_branched_particles()
+    particles = get_branched_particles()
+    del particles[3]
+    particles[1]["neighbor_ids"] = [0, 2]
+    particles[2]["position"] = 5 * np.ones(3)
+    particles[4] = {"type_name": "arp3", "position": np.zeros(3), "neighbor_ids": []}
+    previous_arrays = get_monomer_arrays(
+        {"topologies": {}, "particles": previous_particles}
+    )
+    new_arrays = get_monomer_arrays({"topologies": {}, "particles": particles})
+    update = get_monomer_arrays_update(previous_arrays, new_arrays)
+    assert update["_delete"].tolist() == [3]
+    assert update["_add"]["ids"].tolist() == [1, 2, 4]
+    result = get_monomers_from_arrays(update_monomer_arrays(previous_arrays, update))
+    assert sorted(result["particles"].keys()) == [0, 1, 2, 4]
+    for particle_id, particle in result["particles"].items():
+        expected = particles[particle_id]
+        assert particle["type_name"] == expected["type_name"]
+        assert np.allclose(particle["position"], expected["position"])
+        assert particle["neighbor_ids"] == expected["neighbor_ids"]
+
+
+def test_particle_ids_are_checked():
+    """
+    Test that missing neighbor ids and non-integer particle ids
+    raise instead of mapping to the wrong particle
+    """
+    particles = get_branched_particles()
+    monomer_arrays = get_monomer_arrays({"topologies": {}, "particles": particles})
+    assert get_particle_indices(monomer_arrays, [3, 0]).tolist() == [3, 0]
+    with pytest.raises(ValueError):
+        get_particle_indices(monomer_arrays, [2, 7])
+    particles[2]["neighbor_ids"] = [1, 7]
+    with pytest.raises(ValueError):
+        get_edge_indices_from_arrays(
+            get_monomer_arrays({"topologies": {}, "particles": particles})
+        )
+    uuid_particles = {
+        "5c0e2e4a-7f0c-4e8e-9d0e-3c2a1b0f9e8d": {
+            "type_name": "actin",
+            "position": np.zeros(3),
+            "neighbor_ids": [],
+        }
+    }
+    with pytest.raises(ValueError):
+        get_monomer_arrays({"topologies": {}, "particles": uuid_particles})
@@ -5,7 +5,17 @@
 Tests for actin ReaDDy models
 """
 
-# from vivarium_models import ReaddyActinProcess
+import copy
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from vivarium_models.library.telemetry import LoopTelemetry
+from vivarium_models.processes.readdy_actin_process import (
+    ReaddyActinProcess,
+    get_monomer_data,
+)
 
 
 def test_readdy_actin_process():
@@ -37,3 +47,206 @@ def test_readdy_actin_process():
     #         assert output["particles"][str(particle_ids[1])]["neighbor_ids"] == [0]
     # assert found_monomer
     # assert found_dimer
+
+
+def test_neighbor_list_expired():
+    """
+    Test that the neighbor list expires when particles are added or removed
+    or any particle moves more than half the skin
+    """
+    ids = np.arange(3)
+    positions = np.zeros((3, 3))
+    moved = positions.copy()
+    moved[1, 0] = 0.9
+    expired = ReaddyActinProcess._neighbor_list_expired
+    assert not expired((ids, positions), (ids, moved), 2.0)
+    moved[1, 0] = 1.1
+    assert expired((ids, positions), (ids, moved), 2.0)
+    assert expired((ids, positions), (ids[:2], positions[:2]), 2.0)
+    assert expired((ids, positions), (np.array([0, 1, 5]), positions), 2.0)
+
+
+def get_new_topology_ids(change_monomers):
+    previous_monomers = copy.deepcopy(get_monomer_data()["monomers"])
+    monomers = copy.deepcopy(previous_monomers)
+    change_monomers(monomers)
+    return ReaddyActinProcess._get_new_topology_ids(
+        previous_monomers, monomers, position_tolerance=1e-6
+    )
+
+
+def add_topology(monomers):
+    monomers["topologies"]["new"] = {
+        "type_name": "Actin-Monomer",
+        "particle_ids": [1000],
+    }
+    monomers["particles"][1000] = {
+        "type_name": "actin#free_ATP",
+        "position": np.ones(3),
+        "neighbor_ids": [],
+    }
+
+
+def remove_topology(monomers):
+    topology_id = next(iter(monomers["topologies"]))
+    for particle_id in monomers["topologies"].pop(topology_id)["particle_ids"]:
+        del monomers["particles"][particle_id]
+
+
+def move_particle(monomers):
+    particle_id = next(iter(monomers["particles"]))
+    monomers["particles"][particle_id]["position"] = (
+        monomers["particles"][particle_id]["position"] + 1.0
+    )
+
+
+def retype_topology(monomers):
+    topology_id = next(iter(monomers["topologies"]))
+    monomers["topologies"][topology_id]["type_name"] = "Arp23-Dimer"
+
+
+def test_get_new_topology_ids():
+    """
+    Test that only added topologies are loaded incrementally,
+    and that removed or changed topologies reload the kernel
+    """
+    assert get_new_topology_ids(lambda monomers: None) == []
+    assert get_new_topology_ids(add_topology) == ["new"]
+    assert get_new_topology_ids(remove_topology) is None
+    assert get_new_topology_ids(move_particle) is None
+    assert get_new_topology_ids(retype_topology) is None
+
+
+class RecordedActions:
+    """
+    ReaDDy loop actions that record the order they are called in,
+    where react() does a reaction at the steps in reaction_steps
+    """
+
+    def __init__(self, process, reaction_steps):
+        self.process = process
+        self.reaction_steps = reaction_steps
+        self.calls = []
+        self.step = 0
+
+    def record(self, name):
+        return lambda *args: self.calls.append((self.step, name))
+
+    def initialize_kernel(self):
+        return self.record("init")
+
+    def integrator_euler_brownian_dynamics(self, timestep):
+        def diffuse():
+            self.step += 1
+            self.calls.append((self.step, "diffuse"))
+
+        return diffuse
+
+    def calculate_forces(self):
+        return self.record("calculate_forces")
+
+    def create_neighbor_list(self, cutoff):
+        return self.record("create_nl")
+
+    def update_neighbor_list(self):
+        return self.record("update_nl")
+
+    def reaction_handler_uncontrolled_approximation(self, timestep):
+        return self.record("react")
+
+    def evaluate_observables(self):
+        def observe(t):
+            self.calls.append((self.step, "observe"))
+            n_reactions = 1 if self.step in self.reaction_steps else 0
+            self.process.count_reactions(({"fake": n_reactions}, {}, {}))
+
+        return observe
+
+
+class RecordedSimulation:
+    def __init__(self, actions):
+        self._actions = actions
+        self.current_particles = [
+            SimpleNamespace(id=index, pos=np.zeros(3)) for index in range(3)
+        ]
+
+    def _run_custom_loop(self, loop, show_summary=False):
+        loop()
+
+
+def get_recorded_process(parameters):
+    """
+    Get a ReaddyActinProcess with the given parameters
+    without building its ReaDDy system
+    """
+    process = ReaddyActinProcess.__new__(ReaddyActinProcess)
+    process._parameters = {
+        **ReaddyActinProcess.defaults,
+        "internal_timestep": 1.0,
+        **parameters,
+    }
+    return process
+
+
+def get_loop_calls(parameters, reaction_steps=(), n_steps=12):
+    """
+    Run the ReaDDy loop of a ReaddyActinProcess for n_steps
+    with recorded actions and particles that never move
+    """
+    process = get_recorded_process(parameters)
+    process.telemetry = LoopTelemetry("test")
+    process.reactions_occurred = False
+    process.readdy_system = SimpleNamespace(
+        calculate_max_cutoff=lambda: SimpleNamespace(magnitude=5.0)
+    )
+    actions = RecordedActions(process, reaction_steps)
+    process.readdy_simulation = RecordedSimulation(actions)
+    process.simulate_readdy(n_steps * 1e-9)
+    return actions.calls
+
+
+def test_verlet_rebuilds_after_reactions():
+    """
+    Test that the verlet scheme only updates the neighbor list
+    after a step with reactions, before forces are calculated,
+    and at the next check since the reference positions are stale
+    """
+    verlet = {"integrator_scheme": "verlet"}
+    calls = get_loop_calls(verlet, reaction_steps=[])
+    assert [step for step, name in calls if name == "update_nl"] == [0]
+    calls = get_loop_calls(verlet, reaction_steps=[3])
+    assert [step for step, name in calls if name == "update_nl"] == [0, 3, 10]
+    step_3 = [name for step, name in calls if step == 3]
+    assert step_3 == [
+        "diffuse",
+        "react",
+        "observe",
+        "update_nl",
+        "calculate_forces",
+    ]
+
+
+@pytest.mark.parametrize(
+    "parameters, n_steps, expected_stride, expected_steps",
+    [
+        ({"observe_stride": 5}, 10, 5, [0, 5, 10]),
+        ({"observe_stride": 4}, 10, 4, [0, 4, 8, 10]),
+        ({"observe_stride": 4}, 0, 4, [0]),
+        ({"observe_last_only": True}, 10, 0, [10]),
+        ({"observe_last_only": True}, 0, 0, [0]),
+        ({"integrator_scheme": "verlet"}, 3, 1, [0, 1, 2, 3]),
+    ],
+)
+def test_observe_schedule(parameters, n_steps, expected_stride, expected_steps):
+    """
+    Test the observe stride and number of observed steps,
+    and that the loop evaluates observables at exactly those steps
+    """
+    schedule = get_recorded_process(parameters).get_observe_schedule(n_steps)
+    assert schedule == {
+        "stride": expected_stride,
+        "n_steps": n_steps,
+        "n_observed": len(expected_steps),
+    }
+    calls = get_loop_calls(parameters, n_steps=n_steps)
+    assert [step for step, name in calls if name == "observe"] == expected_steps
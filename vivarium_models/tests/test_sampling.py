@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for sampling scan parameter sets
+"""
+
+import numpy as np
+
+from vivarium_models.library.sampling import ParameterSampler
+
+BOUNDS = {"rate": (1.0, 3.0), "concentration": (-10.0, 10.0)}
+
+
+def get_points(sampler, parameter_sets):
+    return np.array(
+        [
+            [parameter_set["parameters"][name] for name in sampler.parameter_names]
+            for parameter_set in parameter_sets.values()
+        ]
+    )
+
+
+def test_latin_hypercube():
+    """
+    Test that Latin hypercube points are within bounds
+    with one point in each interval along every parameter
+    """
+    sampler = ParameterSampler(BOUNDS, {}, {"timestep": 0.1}, seed=0)
+    parameter_sets = sampler.latin_hypercube(8)
+    assert len(parameter_sets) == 8
+    points = get_points(sampler, parameter_sets)
+    assert np.all(points >= sampler.lower_bounds)
+    assert np.all(points <= sampler.upper_bounds)
+    strata = np.floor(8 * sampler.get_unit_points(parameter_sets)).astype(int)
+    for dimension in range(sampler.n_dimensions):
+        assert sorted(strata[:, dimension]) == list(range(8))
+    for parameter_set in parameter_sets.values():
+        assert parameter_set["parameters"]["timestep"] == 0.1
+
+
+def test_sobol():
+    """
+    Test that Sobol points are within bounds
+    with one point in each half along every parameter
+    """
+    sampler = ParameterSampler(BOUNDS, {}, seed=0)
+    parameter_sets = sampler.sobol(8)
+    points = get_points(sampler, parameter_sets)
+    assert np.all(points >= sampler.lower_bounds)
+    assert np.all(points <= sampler.upper_bounds)
+    halves = np.floor(2 * sampler.get_unit_points(parameter_sets)).astype(int)
+    for dimension in range(sampler.n_dimensions):
+        assert np.sum(halves[:, dimension]) == 4
+
+
+def test_refine():
+    """
+    Test that refining adds a point between the parameter sets
+    whose metric changes most
+    """
+    sampler = ParameterSampler({"rate": (0.0, 1.0)}, {})
+    parameter_sets = sampler.get_parameter_sets(np.linspace(0.0, 1.0, 5)[:, None])
+    values = [0.0, 0.0, 0.0, 1.0, 1.0]
+    results = {
+        id: {"metrics": {"value": value}} for id, value in zip(parameter_sets, values)
+    }
+    new_parameter_sets = sampler.refine(parameter_sets, results, "value", 1)
+    assert len(new_parameter_sets) == 1
+    new_parameters = list(new_parameter_sets.values())[0]["parameters"]
+    assert np.isclose(new_parameters["rate"], 0.625)
+
+
+def test_sampled_ids_dont_collide():
+    """
+    Test that sampled ids don't overwrite ids given by the user
+    or sampled before
+    """
+    sampler = ParameterSampler(BOUNDS, {}, seed=0)
+    parameter_sets = {
+        "0": {"parameters": {"rate": 1.0, "concentration": 0.0}, "states": {}},
+        "1": {"parameters": {"rate": 3.0, "concentration": 0.0}, "states": {}},
+    }
+    sampled = sampler.latin_hypercube(4)
+    assert not set(sampled) & set(parameter_sets)
+    parameter_sets.update(sampled)
+    parameter_sets["sample_4"] = parameter_sets.pop("sample_3")
+    results = {
+        id: {"metrics": {"value": float(index)}}
+        for index, id in enumerate(parameter_sets)
+    }
+    refined = sampler.refine(parameter_sets, results, "value", 3)
+    assert len(refined) == 3
+    assert not set(refined) & set(parameter_sets)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for parameter scans
+"""
+
+import numpy as np
+import pytest
+from vivarium.core.process import Process
+
+from vivarium_models.library.scan import Scan, ScanResultsStore, thin_trajectory
+
+
+class RandomValue(Process):
+    """
+    Set a value to a random number each step
+    """
+
+    def ports_schema(self):
+        return {"value": {"_default": 0.0, "_updater": "set", "_emit": True}}
+
+    def next_update(self, timestep, states):
+        return {"value": np.random.random()}
+
+
+class RandomSimulator:
+    """
+    A picklable simulator class with one RandomValue process
+    """
+
+    def __init__(self, parameters):
+        self.parameters = parameters
+
+    def generate(self):
+        if self.parameters.get("fail", False):
+            raise ValueError("this parameter set fails")
+        return {
+            "processes": {"random": RandomValue()},
+            "topology": {"random": {"value": ("value",)}},
+        }
+
+
+def last_value(data):
+    return data[max(data.keys())]["value"]
+
+
+def test_scan_results_store(tmp_path):
+    """
+    Test that results are read back by id, skipping an incomplete line
+    """
+    store = ScanResultsStore(str(tmp_path / "scan" / "results.jsonl"))
+    assert store.read() == {}
+    store.append(1, {"metrics": {"count": np.int64(3), "lengths": np.ones(2)}})
+    store.append("2", {"metrics": {"count": 4, "lengths": []}})
+    with open(store.path, "a") as results_file:
+        results_file.write('{"id": "3", "metr')
+    results = store.read()
+    assert list(results.keys()) == ["1", "2"]
+    assert results["1"] == {"metrics": {"count": 3, "lengths": [1.0, 1.0]}}
+
+
+def test_thin_trajectory():
+    """
+    Test that every stride-th time point and the last one are kept
+    """
+    data = {float(time): {"value": time} for time in range(10)}
+    assert list(thin_trajectory(data, 4).keys()) == [0.0, 4.0, 8.0, 9.0]
+
+
+def test_scan_workers_and_seeds():
+    """
+    Test that runs in worker processes match serial runs with the same seeds,
+    and that each parameter set gets its own seed unless it has one
+    """
+    parameter_sets = {id: {"parameters": {}, "states": {}} for id in ["a", "b", "c"]}
+    parameter_sets["c"]["seed"] = 1
+    metrics = {"value": last_value}
+    serial = Scan(
+        parameter_sets, RandomSimulator, 2.0, metrics=metrics, keep_data=True, seed=1
+    ).run_scan()
+    parallel = Scan(
+        parameter_sets, RandomSimulator, 2.0, metrics=metrics, n_workers=2, seed=1
+    ).run_scan()
+    assert "data" in serial["a"]
+    assert "data" not in parallel["a"]
+    for id in parameter_sets:
+        assert parallel[id]["metrics"] == serial[id]["metrics"]
+    assert serial["a"]["metrics"] != serial["b"]["metrics"]
+    # "a" is seeded with seed + index 0, the same seed "c" gives itself
+    assert serial["a"]["metrics"] == serial["c"]["metrics"]
+
+
+def test_scan_saves_runs_after_a_failure(tmp_path):
+    """
+    Test that a failing run in a worker raises only after
+    every other run is saved to the results store
+    """
+    parameter_sets = {id: {"parameters": {}, "states": {}} for id in "abcd"}
+    parameter_sets["a"]["parameters"]["fail"] = True
+    results_path = str(tmp_path / "results.jsonl")
+    scan = Scan(
+        parameter_sets,
+        RandomSimulator,
+        2.0,
+        metrics={"value": last_value},
+        n_workers=2,
+        results_path=results_path,
+    )
+    with pytest.raises(ValueError):
+        scan.run_scan()
+    assert sorted(ScanResultsStore(results_path).read().keys()) == ["b", "c", "d"]
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the shared port schemas
+"""
+
+from vivarium_models.library.schema import fibers_schema, monomers_schema
+
+
+def test_schemas_are_cached():
+    """
+    Test that each set of arguments builds its schema once
+    """
+    assert monomers_schema() is monomers_schema()
+    assert fibers_schema() is fibers_schema()
+    assert monomers_schema(compact=True) is not monomers_schema()
+
+
+def test_schema_options():
+    """
+    Test that the arguments select the ports and variables in the schema
+    """
+    assert set(monomers_schema()) == {
+        "box_center",
+        "box_size",
+        "topologies",
+        "particles",
+    }
+    assert set(monomers_schema(box=False, observe_schedule=True)) == {
+        "observe_schedule",
+        "topologies",
+        "particles",
+    }
+    compact = monomers_schema(compact=True)
+    assert set(compact) == {"box_center", "box_size", "monomer_arrays"}
+    assert compact["monomer_arrays"]["_updater"] == "monomer_arrays"
+    assert set(fibers_schema()) == {"fibers", "fibers_box_extent"}
+    assert set(fibers_schema(box_extent=False)) == {"fibers"}
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the Simularium emitter
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from vivarium_models.library.simularium_writer import read_float32
+from vivarium_models.library.trajectory import TrajectoryBuffer
+from vivarium_models.processes.fiber_to_monomer import FiberToMonomer
+from vivarium_models.processes.simularium_emitter import SimulariumEmitter
+
+
+def get_output_path(parameters, time_created):
+    """
+    Resolve the output path of an emitter configured
+    like a run of one FiberToMonomer process
+    """
+    emitter = SimulariumEmitter({"output_path": "out/{parameters_hash}"})
+    emitter.emit(
+        {
+            "table": "configuration",
+            "data": {
+                "time_created": time_created,
+                "experiment_id": time_created,
+                "processes": {"fiber_to_monomer": FiberToMonomer(parameters)},
+            },
+        }
+    )
+    return emitter.get_output_path()
+
+
+def test_parameters_hash_output_path():
+    """
+    Test that runs with the same parameters write to the same path
+    and runs with different parameters don't
+    """
+    parameters = {"tolerance": np.float64(2.0), "box": np.zeros(3)}
+    path = get_output_path(parameters, "run 1")
+    assert path == get_output_path(dict(parameters), "run 2")
+    assert path != get_output_path({"tolerance": 1.0}, "run 1")
+
+
+def emit_fiber_frames(emitter, n_frames):
+    """
+    Emit the configuration then n_frames frames of one fiber
+    whose end is at x = 10 * time
+    """
+    emitter.emit(
+        {
+            "table": "configuration",
+            "data": {"processes": {"fiber_to_monomer": FiberToMonomer()}},
+        }
+    )
+    for time in range(n_frames):
+        emitter.emit(
+            {
+                "table": "history",
+                "data": {
+                    "time": time,
+                    "choices": {"medyan_active": True},
+                    "fibers_box_extent": np.array([100.0, 100.0, 100.0]),
+                    "fibers": {
+                        "1": {
+                            "type_name": "Actin-Polymer",
+                            "points": np.array([[0.0, 0.0, 0.0], [10.0 * time, 0, 0]]),
+                        }
+                    },
+                },
+            }
+        )
+
+
+def test_streaming_needs_get_data(tmp_path):
+    """
+    Test that a streamed file is only at its final path after get_data,
+    with the same trajectory info fields as simulariumio writes
+    """
+    emitter = SimulariumEmitter(
+        {"output_path": str(tmp_path / "test"), "streaming": True}
+    )
+    emit_fiber_frames(emitter, 3)
+    emitter.flush()
+    output_path = tmp_path / "test.simularium"
+    assert not output_path.exists()
+    emitter.get_data()
+    assert [path.name for path in tmp_path.iterdir()] == ["test.simularium"]
+    with open(output_path) as simularium_file:
+        trajectory_info = json.load(simularium_file)["trajectoryInfo"]
+    assert trajectory_info["totalSteps"] == 3
+    assert trajectory_info["cameraDefault"]["fovDegrees"] == 75.0
+    assert trajectory_info["typeMapping"]["0"] == {
+        "name": "Actin-Polymer",
+        "geometry": {"displayType": "FIBER"},
+    }
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_float32_frame_stride(tmp_path, streaming):
+    """
+    Test that a float32 file reads back with read_float32
+    and keeps only every frame_stride-th frame
+    """
+    emitter = SimulariumEmitter(
+        {
+            "output_path": str(tmp_path / "test"),
+            "output_format": "float32",
+            "frame_stride": 2,
+            "streaming": streaming,
+        }
+    )
+    emit_fiber_frames(emitter, 5)
+    emitter.get_data()
+    with open(tmp_path / "test.simf32", "rb") as float32_file:
+        trajectory_info, frames = read_float32(float32_file.read())
+    assert trajectory_info["totalSteps"] == 3
+    assert trajectory_info["typeMapping"]["0"]["name"] == "Actin-Polymer"
+    # scaled end x of the fiber at times 0, 2 and 4
+    assert np.allclose([frame[14] for frame in frames], [0.0, 2.0, 4.0])
+    assert np.allclose(frames[1][:11], [1001, 0, 0, 0, 0, 0, 0, 0, 0, 0.3, 6])
+
+
+@pytest.mark.parametrize("output_format", ["json", "float32"])
+def test_asynchronous_matches_streaming(tmp_path, output_format):
+    """
+    Test that writing frames on a background thread
+    writes the same file as streaming them
+    """
+    output = {}
+    for mode in ["streaming", "asynchronous"]:
+        emitter = SimulariumEmitter(
+            {
+                "output_path": str(tmp_path / mode / "test"),
+                "output_format": output_format,
+                mode: True,
+                "queue_size": 2,
+            }
+        )
+        emit_fiber_frames(emitter, 6)
+        emitter.get_data()
+        (output_path,) = (tmp_path / mode).iterdir()
+        output[mode] = output_path.read_bytes()
+    assert output["asynchronous"] == output["streaming"]
+
+
+def get_list_based_trajectory(states, actin_radius):
+    """
+    Build jagged lists of agent data for each state the way
+    the emitter did before TrajectoryBuffer, then pad them with zeros
+    """
+    frames = []
+    prev_simulator = "none"
+    for state in states:
+        current_simulator = SimulariumEmitter.get_active_simulator(state["choices"])
+        simulator = current_simulator if prev_simulator == "none" else prev_simulator
+        prev_simulator = current_simulator
+        if simulator == "medyan":
+            fibers = state["fibers"]
+            frames.append(
+                {
+                    "unique_ids": [int(fiber_id) for fiber_id in fibers],
+                    "type_names": [fiber["type_name"] for fiber in fibers.values()],
+                    "viz_types": len(fibers) * [1001.0],
+                    "positions": len(fibers) * [[0.0, 0.0, 0.0]],
+                    "radii": len(fibers) * [actin_radius],
+                    "subpoints": [fiber["points"] for fiber in fibers.values()],
+                }
+            )
+            continue
+        particles = state["monomers"]["particles"]
+        edge_ids = []
+        edge_positions = []
+        for particle_id, particle in particles.items():
+            for neighbor_id in particle["neighbor_ids"]:
+                edge = (particle_id, str(neighbor_id))
+                if edge not in edge_ids and edge[::-1] not in edge_ids:
+                    edge_ids.append(edge)
+                    edge_positions.append(
+                        [particle["position"], particles[str(neighbor_id)]["position"]]
+                    )
+        n_edges = len(edge_ids)
+        frames.append(
+            {
+                "unique_ids": [int(particle_id) for particle_id in particles]
+                + [1000 + i for i in range(n_edges)],
+                "type_names": [particle["type_name"] for particle in particles.values()]
+                + n_edges * ["edge"],
+                "viz_types": len(particles) * [1000.0] + n_edges * [1001.0],
+                "positions": [particle["position"] for particle in particles.values()]
+                + n_edges * [[0.0, 0.0, 0.0]],
+                "radii": len(particles) * [actin_radius] + n_edges * [1.0],
+                "subpoints": len(particles) * [[]] + edge_positions,
+            }
+        )
+    max_agents = max(len(frame["unique_ids"]) for frame in frames)
+    max_subpoints = max(
+        len(points) for frame in frames for points in frame["subpoints"]
+    )
+    result = {
+        "n_agents": np.array([len(frame["unique_ids"]) for frame in frames]),
+        "viz_types": np.full((len(frames), max_agents), 1000.0),
+        "unique_ids": np.zeros((len(frames), max_agents), dtype=int),
+        "types": [frame["type_names"] for frame in frames],
+        "positions": np.zeros((len(frames), max_agents, 3)),
+        "radii": np.zeros((len(frames), max_agents)),
+        "n_subpoints": np.zeros((len(frames), max_agents), dtype=int),
+        "subpoints": np.zeros((len(frames), max_agents, max_subpoints, 3)),
+    }
+    for index, frame in enumerate(frames):
+        n_agents = len(frame["unique_ids"])
+        result["viz_types"][index, :n_agents] = frame["viz_types"]
+        result["unique_ids"][index, :n_agents] = frame["unique_ids"]
+        result["positions"][index, :n_agents] = frame["positions"]
+        result["radii"][index, :n_agents] = frame["radii"]
+        for agent_index, points in enumerate(frame["subpoints"]):
+            result["n_subpoints"][index, agent_index] = len(points)
+            if len(points) > 0:
+                result["subpoints"][index, agent_index, : len(points)] = points
+    return result
+
+
+def test_trajectory_matches_list_based():
+    """
+    Test that the emitter's TrajectoryBuffer, built in one pass
+    over the sorted frames, matches the previous list-based construction
+    """
+    monomers = {
+        "box_center": np.zeros(3),
+        "box_size": 500.0,
+        "topologies": {},
+        "particles": {
+            "0": {
+                "type_name": "actin#1",
+                "position": np.array([0.0, 0.0, 0.0]),
+                "neighbor_ids": [1],
+            },
+            "1": {
+                "type_name": "actin#2",
+                "position": np.array([4.0, 1.0, 0.0]),
+                "neighbor_ids": [0, 2],
+            },
+            "2": {
+                "type_name": "actin#3",
+                "position": np.array([8.0, 0.0, 1.0]),
+                "neighbor_ids": [1],
+            },
+        },
+    }
+    fibers = {
+        "0": {
+            "type_name": "Actin-Polymer",
+            "points": np.array([[0.0, 0.0, 0.0], [5.0, 0.0, 0.0], [9.0, 1.0, 0.0]]),
+        },
+        "1": {
+            "type_name": "Actin-Polymer",
+            "points": np.array([[0.0, 3.0, 0.0], [0.0, 9.0, 0.0]]),
+        },
+    }
+    states = [
+        {"choices": {"readdy_active": True}, "monomers": monomers},
+        {"choices": {"medyan_active": True}, "monomers": monomers},
+        {"choices": {"medyan_active": True}, "fibers": fibers},
+        {"choices": {"readdy_active": True}, "fibers": fibers},
+        {"choices": {"readdy_active": True}, "monomers": monomers},
+    ]
+    for state in states:
+        state["fibers_box_extent"] = np.array([100.0, 100.0, 100.0])
+    emitter = SimulariumEmitter({})
+    emitter.emit(
+        {
+            "table": "configuration",
+            "data": {"processes": {"fiber_to_monomer": FiberToMonomer()}},
+        }
+    )
+    # emitted out of order, frames are still visualized in order of time
+    for time in [3, 1, 0, 4, 2]:
+        emitter.emit({"table": "history", "data": {"time": time, **states[time]}})
+    agent_data = emitter.get_trajectory().get_agent_data()
+    expected = get_list_based_trajectory(states, actin_radius=3.0)
+    assert agent_data.types == expected["types"]
+    for key in [
+        "n_agents",
+        "viz_types",
+        "unique_ids",
+        "positions",
+        "radii",
+        "n_subpoints",
+        "subpoints",
+    ]:
+        assert np.array_equal(getattr(agent_data, key), expected[key]), key
+
+
+def test_region_keeps_crossing_fibers():
+    """
+    Test that culling to a region keeps fibers with a segment
+    crossing the region even when all their points are outside it,
+    and keeps only the monomers inside it
+    """
+    with pytest.raises(ValueError):
+        SimulariumEmitter({"region_center": np.zeros(3)})
+    emitter = SimulariumEmitter({"region_center": np.zeros(3), "region_size": 100.0})
+    fibers = {
+        "crossing": {
+            "type_name": "Actin-Polymer",
+            "points": np.array([[-500.0, 0.0, 0.0], [500.0, 0.0, 0.0]]),
+        },
+        "outside": {
+            "type_name": "Actin-Polymer",
+            "points": np.array([[-500.0, 200.0, 0.0], [500.0, 200.0, 0.0]]),
+        },
+        "bent": {
+            "type_name": "Actin-Polymer",
+            "points": np.array([[-500.0, 0.0, 90.0], [0.0, 0.0, 0.0], [0, 0, 300]]),
+        },
+    }
+    trajectory = emitter.get_simularium_fibers(0, fibers, 3.0, TrajectoryBuffer())
+    assert trajectory.n_agents[0] == 2
+    assert emitter.fiber_unique_ids == {"crossing": 0, "bent": 1}
+    monomers = {
+        "topologies": {},
+        "particles": {
+            "0": {
+                "type_name": "actin",
+                "position": np.zeros(3),
+                "neighbor_ids": [1],
+            },
+            "1": {
+                "type_name": "actin",
+                "position": np.array([100.0, 0.0, 0.0]),
+                "neighbor_ids": [0],
+            },
+        },
+    }
+    trajectory = emitter.get_simularium_monomers(0, monomers, 3.0, TrajectoryBuffer())
+    assert trajectory.n_agents[0] == 1
+    assert trajectory.types == [["actin"]]
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_max_frames(tmp_path, streaming):
+    """
+    Test that max_frames keeps evenly spaced frames,
+    or the first frames when streaming
+    """
+    emitter = SimulariumEmitter(
+        {
+            "output_path": str(tmp_path / "test"),
+            "output_format": "float32",
+            "max_frames": 3,
+            "streaming": streaming,
+        }
+    )
+    emit_fiber_frames(emitter, 10)
+    emitter.get_data()
+    with open(tmp_path / "test.simf32", "rb") as float32_file:
+        trajectory_info, frames = read_float32(float32_file.read())
+    assert trajectory_info["totalSteps"] == 3
+    # scaled end x of the fiber at the kept times
+    expected_times = [0.0, 1.0, 2.0] if streaming else [0.0, 4.0, 9.0]
+    assert np.allclose([frame[14] for frame in frames], expected_times)
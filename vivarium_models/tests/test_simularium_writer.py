@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for writing Simularium trajectories in chunks
+"""
+
+import json
+
+import numpy as np
+
+from vivarium_models.library.simularium_writer import (
+    SimulariumStreamWriter,
+    get_float32_bytes,
+    read_float32,
+)
+from vivarium_models.library.trajectory import TrajectoryBuffer
+
+
+def get_test_trajectory():
+    """
+    A frame with one monomer and one edge
+    """
+    trajectory = TrajectoryBuffer()
+    trajectory.add_frame(
+        [5, 1000],
+        ["actin", "edge"],
+        [1000.0, 1001.0],
+        np.array([[10.0, 20.0, 30.0], [0.0, 0.0, 0.0]]),
+        [3.0, 1.0],
+        np.array([0, 2]),
+        np.array(
+            [[[0.0, 0.0, 0.0], [0.0, 0.0, 0.0]], [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]]
+        ),
+    )
+    return trajectory
+
+
+def test_stream_json(tmp_path):
+    """
+    Test that frames written in chunks make one Simularium JSON file
+    """
+    writer = SimulariumStreamWriter(str(tmp_path / "test"), scale_factor=0.1)
+    writer.write_frames(get_test_trajectory())
+    writer.write_frames(get_test_trajectory())
+    writer.close(np.array([100.0, 100.0, 100.0]))
+    with open(writer.path) as simularium_file:
+        data = json.load(simularium_file)
+    frames = data["spatialData"]["bundleData"]
+    assert [frame["frameNumber"] for frame in frames] == [0, 1]
+    assert np.allclose(frames[1]["data"][:11], [1000, 5, 0, 1, 2, 3, 0, 0, 0, 0.3, 0])
+    assert np.allclose(
+        frames[1]["data"][11:],
+        [1001, 1000, 1, 0, 0, 0, 0, 0, 0, 0.1, 6] + [0.1, 0.2, 0.3, 0.4, 0.5, 0.6],
+    )
+    assert data["trajectoryInfo"]["totalSteps"] == 2
+    assert data["trajectoryInfo"]["typeMapping"]["0"]["geometry"] == {
+        "displayType": "SPHERE"
+    }
+    assert data["trajectoryInfo"]["typeMapping"]["1"] == {
+        "name": "edge",
+        "geometry": {"displayType": "FIBER"},
+    }
+    assert data["trajectoryInfo"]["cameraDefault"]["position"] == {
+        "x": 0.0,
+        "y": 0.0,
+        "z": 120.0,
+    }
+    assert [path.name for path in tmp_path.iterdir()] == ["test.simularium"]
+
+
+def test_float32_round_trip():
+    """
+    Test that float32 data reads back the same values as JSON
+    """
+    trajectory_info, frames = read_float32(
+        get_float32_bytes(get_test_trajectory(), None, 0.1)
+    )
+    assert trajectory_info["totalSteps"] == 1
+    assert len(frames) == 1
+    assert frames[0].shape == (28,)
+    assert np.allclose(frames[0][22:], [0.1, 0.2, 0.3, 0.4, 0.5, 0.6])
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for simulation loop progress summaries
+"""
+
+import pytest
+
+from vivarium_models.library.telemetry import LoopTelemetry
+
+
+@pytest.mark.parametrize("interval", [0, None])
+def test_disabled_telemetry(interval):
+    """
+    Test that disabled telemetry runs all steps in one chunk and never reports
+    """
+    summaries = []
+    telemetry = LoopTelemetry("test", interval, summaries.append)
+    assert not telemetry.enabled
+    assert telemetry.get_chunks(10) == [(1, 10)]
+    telemetry.start(10)
+    telemetry.report(10)
+    assert summaries == []
+
+
+@pytest.mark.parametrize(
+    "n_steps, expected_chunks",
+    [
+        (8, [(1, 4), (5, 8)]),
+        (10, [(1, 4), (5, 8), (9, 10)]),
+        (3, [(1, 3)]),
+        (0, []),
+    ],
+)
+def test_telemetry_chunks(n_steps, expected_chunks):
+    """
+    Test that chunks cover every step once, with a short last chunk
+    when n_steps isn't a multiple of the interval, and are reported
+    """
+    summaries = []
+    telemetry = LoopTelemetry("test", 4, summaries.append)
+    chunks = telemetry.get_chunks(n_steps)
+    assert chunks == expected_chunks
+    telemetry.start(n_steps)
+    for _, last_step in chunks:
+        telemetry.report(last_step)
+    assert [summary["step"] for summary in summaries] == [
+        last_step for _, last_step in expected_chunks
+    ]
+    for summary in summaries:
+        assert summary["name"] == "test"
+        assert summary["n_steps"] == n_steps
+        assert summary["elapsed"] >= 0
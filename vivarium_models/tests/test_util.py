@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for agent updates
+"""
+
+import numpy as np
+
+from vivarium_models.util import agents_update, get_update_size
+
+
+def test_agents_update_diff():
+    """
+    Test that only agents and fields that changed are in the update
+    """
+    existing = {
+        1: {"type_name": "actin", "position": np.zeros(3), "neighbor_ids": [2]},
+        2: {"type_name": "actin", "position": np.ones(3), "neighbor_ids": [1]},
+        3: {"type_name": "arp2", "position": np.ones(3), "neighbor_ids": []},
+    }
+    projected = {
+        1: {"type_name": "actin", "position": np.full(3, 1e-8), "neighbor_ids": [2]},
+        2: {"type_name": "actin", "position": np.ones(3), "neighbor_ids": [1, 4]},
+        4: {"type_name": "actin", "position": np.zeros(3), "neighbor_ids": [2]},
+    }
+    update = agents_update(existing, projected)
+    assert list(update.keys()) == ["_add", "_delete", 2]
+    assert update[2] == {"neighbor_ids": [1, 4]}
+    assert [add["key"] for add in update["_add"]] == [4]
+    assert update["_delete"] == [3]
+    assert get_update_size({"particles": update}) == {
+        "added": 1,
+        "deleted": 1,
+        "changed": 1,
+        "values": 4,
+    }
+    full_update = agents_update(existing, projected, diff=False)
+    assert get_update_size(full_update)["changed"] == 2
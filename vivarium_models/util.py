@@ -1,29 +1,94 @@
 import numpy as np
 
 
-def agents_update(existing, projected):
+def values_equal(value1, value2, tolerance=0.0):
+    """
+    Compare state values, numbers and arrays within tolerance
+    """
+    if value1 is None or value2 is None:
+        return value1 is value2
+    if isinstance(value1, str) or isinstance(value2, str):
+        return value1 == value2
+    if isinstance(value1, dict) or isinstance(value2, dict):
+        return (
+            isinstance(value1, dict)
+            and isinstance(value2, dict)
+            and value1.keys() == value2.keys()
+            and all(values_equal(value1[key], value2[key], tolerance) for key in value1)
+        )
+    try:
+        array1 = np.asarray(value1, dtype=float)
+        array2 = np.asarray(value2, dtype=float)
+    except (TypeError, ValueError):
+        return value1 == value2
+    return array1.shape == array2.shape and bool(
+        np.all(np.abs(array1 - array2) <= tolerance)
+    )
+
+
+def get_moved(existing, projected, ids, tolerance=0.0):
+    """
+    Check which agents moved by more than tolerance,
+    comparing all their positions at once,
+    or return None if they don't all have a 3D position
+    """
+    try:
+        positions1 = np.array([existing[id]["position"] for id in ids], dtype=float)
+        positions2 = np.array([projected[id]["position"] for id in ids], dtype=float)
+    except (KeyError, TypeError, ValueError):
+        return None
+    if positions1.shape != (len(ids), 3) or positions2.shape != (len(ids), 3):
+        return None
+    return np.any(np.abs(positions1 - positions2) > tolerance, axis=1)
+
+
+def agents_update(existing, projected, diff=True, tolerance=1e-6):
+    """
+    Add new agents, delete missing agents, and set the state of the others.
+    With diff, set only the fields that changed, comparing values
+    within tolerance, so agents that didn't change aren't in the update
+    """
     update = {"_add": [], "_delete": []}
+    common_ids = []
 
     for id, state in projected.items():
-        if id in existing:
-            update[id] = state
-        else:
+        if id not in existing:
             update["_add"].append({"key": id, "state": state})
+        elif diff:
+            common_ids.append(id)
+        else:
+            update[id] = state
 
-    for existing_id in existing.keys():
+    for existing_id in existing:
         if existing_id not in projected:
             update["_delete"].append(existing_id)
 
+    moved = get_moved(existing, projected, common_ids, tolerance)
+    for index, id in enumerate(common_ids):
+        previous_state = existing[id]
+        changes = {}
+        for key, value in projected[id].items():
+            if key == "position" and moved is not None:
+                changed = moved[index]
+            else:
+                changed = key not in previous_state or not values_equal(
+                    previous_state[key], value, tolerance
+                )
+            if changed:
+                changes[key] = value
+        if changes:
+            update[id] = changes
+
     return update
 
 
-def create_monomer_update(previous_monomers, new_monomers):
+def create_monomer_update(previous_monomers, new_monomers, diff=True, tolerance=1e-6):
     topologies_update = agents_update(
-        previous_monomers["topologies"], new_monomers["topologies"]
+        previous_monomers["topologies"], new_monomers["topologies"], diff, tolerance
     )
 
     particles_update = agents_update(
-        previous_monomers["particles"], new_monomers["particles"]
+        previous_monomers["particles"], new_monomers["particles"], diff, tolerance
     )
 
     return {
@@ -31,6 +96,43 @@ def create_monomer_update(previous_monomers, new_monomers):
     }
 
 
+def get_update_size(update):
+    """
+    Measure an update by the number of agents it adds, deletes and changes,
+    and the number of values it sets,
+    counting rows added to columnar monomer arrays as added agents
+    """
+    size = {"added": 0, "deleted": 0, "changed": 0, "values": 0}
+
+    def count_values(state):
+        if isinstance(state, dict):
+            return sum(count_values(value) for value in state.values())
+        return 1
+
+    def measure(update):
+        for key, value in update.items():
+            if key == "_add" and isinstance(value, dict):
+                # rows in a "monomer_arrays" update:
+                # a type, a position and neighbor ids each
+                size["added"] += len(value["ids"])
+                size["values"] += 3 * len(value["ids"])
+            elif key == "_add":
+                size["added"] += len(value)
+                size["values"] += sum(count_values(add["state"]) for add in value)
+            elif key == "_delete":
+                size["deleted"] += len(value)
+            elif isinstance(value, dict):
+                if "_add" in update:
+                    # an agent in an agents update
+                    size["changed"] += 1
+                measure(value)
+            else:
+                size["values"] += 1
+
+    measure(update)
+    return size
+
+
 def format_monomer_results(results):
     """
     Workaround since numpy arrays are not preserved in Vivarium?